@@ -42,7 +42,8 @@ from .basic_instructions import AddAnObject, RemoveAnObject, Move, MoveTo, \
 from .search import Bisect, Newton
 
 # Bezier classes for Bezier Curve manipulation
-from .bezier import BezierCurve, PolyBezier, SVGPolyBezier
+from .bezier import BezierCurve, PolyBezier, TrimmedPolyBezier, \
+                    SVGPolyBezier
 
 # Rendering classes
 from .render import Render, BezierRender, CompositeRender, ImageRender, \
@@ -52,7 +53,8 @@ from .render import Render, BezierRender, CompositeRender, ImageRender, \
 from .camera import Camera
 
 # Backend to manipulate the video stream
-from .backend import Backend
+from .backend import Backend, PreviewBackend, MP4Backend, GIFWriter, \
+                     ImageSequenceBackend, FanOutBackend
 
 # defaults for control of the renderer
 _defaults = {
@@ -57,15 +57,40 @@ class AnObject():
 
     clip : PolyBezier
         A PolyBezier path defining a clip region.
+
+    parent : CompositeAnObject or None
+        The composite this AnObject was last added to.
     """
 
+    # Some subclasses set their data before calling __init__
+    _parent = None
+    _coordinates = None
+    _data = None
+
     def __init__(self,data,renderer,clip=None):
 
+        self._parent     = None
+        self._cairo_matrix = None
         self.data        = data
         self.renderer    = renderer
         self.clip        = clip
-        self._coordinates = al.Coordinates()
+        self.coordinates = al.Coordinates()
+
+    @property
+    def data(self):
+        return self._data
 
+    @data.setter
+    def data(self,data):
+        if isinstance(self._data,al.PolyBezier):
+            self._data.remove_listener(self._bounds_changed)
+        self._data = data
+
+        # Hear about changes made to the path in place
+        if isinstance(data,al.PolyBezier):
+            data.add_listener(self._bounds_changed)
+
+        self._bounds_changed()
 
     @property
     def coordinates(self):
@@ -73,7 +98,46 @@ class AnObject():
 
     @coordinates.setter
     def coordinates(self,coordinates):
+        if self._coordinates is not None:
+            self._coordinates.remove_listener(self._coordinates_changed)
         self._coordinates = coordinates
+        coordinates.add_listener(self._coordinates_changed)
+        self._coordinates_changed()
+
+    @property
+    def parent(self):
+        return self._parent
+
+    def _coordinates_changed(self):
+        """Called by the coordinates whenever the transformation changes"""
+        self._invalidate_matrix()
+
+        # Our place in the composite holding us has moved
+        if self._parent is not None:
+            self._parent._bounds_changed()
+
+    def _bounds_changed(self):
+        """Called whenever the bounding box may have changed"""
+        if self._parent is not None:
+            self._parent._bounds_changed()
+
+    def _invalidate_matrix(self):
+        """Drop the matrix the renderer keeps to place this AnObject"""
+        self._cairo_matrix = None
+
+    def __getstate__(self):
+
+        # Copies start out of any composite and rebuild their matrices
+        state = self.__dict__.copy()
+        state['_parent'] = None
+        state['_cairo_matrix'] = None
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._coordinates.add_listener(self._coordinates_changed)
+        if isinstance(self._data,al.PolyBezier):
+            self._data.add_listener(self._bounds_changed)
 
     @property
     def position(self):
@@ -447,8 +511,14 @@ class CompositeAnObject(AnObject):
     Sub-anobjects can be manipulated through standard array indexing syntax.  If 
     a sub-anobject is a CompositeAnObject, its members can be access by passing a 
     tuple as the index.  
+
+    The bounding box is kept between calls.  Sub-anobjects tell the 
+    composite holding them when their data or coordinates change, and only 
+    then is it worked out again.  
     """
 
+    _bounding_box = None
+
     def __init__(self,anobjects=None,names=None):
 
         super().__init__({}, al.CompositeRender())
@@ -472,10 +542,44 @@ class CompositeAnObject(AnObject):
 
 
     def clear(self):
+
+        # Let go of anything already in the composite
+        for mob in getattr(self,'anobjects',{}).values():
+            if mob._parent is self:
+                mob._parent = None
+                mob._invalidate_matrix()
+
         self.anobjects = {}      # a dictionary with the anobjects.
         self.keys = []           # a simple list of keys to remember the 
                                  # insertion order (z-order)
         self.key_lookup = {}     # Look up the key using the anobject's object id
+        self._bounds_changed()
+
+    def _bounds_changed(self):
+        """Drop the cached bounding box here and in the composites above"""
+
+        # The composites above can only hold a bounding box if this one does
+        if self._bounding_box is None:
+            return
+
+        self._bounding_box = None
+        super()._bounds_changed()
+
+    def _invalidate_matrix(self):
+        """Drop the renderer's matrix here and in every sub-anobject"""
+
+        # Sub-anobjects can only hold a matrix if this one does
+        if self._cairo_matrix is None:
+            return
+
+        super()._invalidate_matrix()
+        for mob in self.anobjects.values():
+            mob._invalidate_matrix()
+
+    def __setstate__(self,state):
+        super().__setstate__(state)
+        for mob in self.anobjects.values():
+            mob._parent = self
 
     def add_anobject(self, anobject, key=None, path=None, update_transform=True):
         """Add an AnObject to the composite
@@ -542,11 +646,15 @@ class CompositeAnObject(AnObject):
                 self.key_lookup[anobject] = key     # Reverse dictionary
                 self.keys.append(key)               # Key list to maintain 
                                                     #          insertion order
+                anobject._parent = self
+                anobject._invalidate_matrix()
                                                     
                 # Fix the transformation matrix
                 if update_transform:
                     anobject.position -= self.position
                     anobject.scale /= self.scale
+
+            self._bounds_changed()
                     
                 
         elif len(path) == 0:                      # ignore empty path
@@ -644,19 +752,22 @@ class CompositeAnObject(AnObject):
         upper right (row 2) of the bounding box.
         """
 
+        if self._bounding_box is not None:
+            return self._bounding_box
+
         if len(self.anobjects) == 0:
-            return np.zeros((2,3))
+            self._bounding_box = np.zeros((2,3))
+            return self._bounding_box
 
         box = []
         for mob in self.anobjects.values():
-            bb = mob.bounding_box
-            bb = mob.internal2external(bb)
             box.append(mob.internal2external(mob.bounding_box))
 
         box = np.array(box)
         box = np.concatenate((box[:,0,:],box[:,1,:]))
 
-        return np.array([box.min(axis=0),box.max(axis=0)])
+        self._bounding_box = np.array([box.min(axis=0),box.max(axis=0)])
+        return self._bounding_box
 
     # def add_anobject(self,anobject,name=None,preserve_transform=True):
     #     """Add an animation object to the collection
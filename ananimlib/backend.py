@@ -7,13 +7,18 @@ Created on Tue Sep 17 12:53:16 2019
 import os
 import os.path
 import subprocess
+import struct
+import threading
+import queue
 import numpy  as np
 import copy   as cp
 
+from concurrent.futures import ThreadPoolExecutor
+
 # Disable pygame support prompt
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "True"
 import pygame as pg
-from   PIL import Image
+from   PIL import Image, GifImagePlugin
 
 class Backend():    
     """Default backend - Buffers frames in memory
@@ -62,7 +67,20 @@ class Backend():
         
         
     def save_frame(self,fname,frame_number=0):
-        pass
+        """Save a single frame as an image
+        
+        The image format is chosen from the file extension.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the image file
+
+        frame_number : optional, int
+            The index of the frame to save.
+            default = 0
+        """
+        Image.fromarray(self.frames[frame_number]).save(fname)
     
     def save_mp4(self,fname):
         """Save the animation as an mp4"""
@@ -89,16 +107,12 @@ class Backend():
             
         If a different frame rate is used, the closest possible integer delay 
         will be selected as round(100/frame_rate)
+
+        Only the region of each frame that changed since the previous frame 
+        is stored and repeated frames are merged.  See GIFWriter.
         """
-        print("save_gif entered")
-        # Convert the frames to a list of PIL images
-        images = [Image.fromarray(f) for f in self.frames]
-        
-        # Write the images to a gif
         print(f"Saving: {fname}")
-        images[0].save(fname,"GIF",save_all=True,
-                       append_images=images[1:], loop=0,optimize=False,disposal=1,
-                       duration = int(np.round(1000/self.frame_rate)))
+        GIFWriter(fname,self.frame_rate).write(self.frames)
 
 
     def end(self):
@@ -161,6 +175,160 @@ class Backend():
 
 
 
+class PreviewBackend(Backend):
+    """Show frames in a pygame window while they are being rendered
+
+    The window opens when the engine calls start() and each frame is 
+    displayed as soon as the engine produces it.  When rendering runs faster
+    than real time, frames that arrive less than one frame time after the 
+    last displayed frame are dropped.  This caps the display rate at the 
+    frame rate without slowing the renderer, but the preview then plays 
+    faster than real time.  The achieved rendering rate is shown in the 
+    window title.
+
+    Each frame is converted to a pygame surface once, on arrival, so that
+    play_movie can replay the animation without converting frames again.
+
+    The window stays open after Animate returns so that consecutive 
+    animations share it.  play_movie closes it when playback ends; 
+    otherwise call close() to dismiss it.
+
+    Parameters
+    ----------
+    width, height : int
+        The dimensions of the frames in pixels
+
+    frame_rate : float
+        The frame rate in frames per second
+
+    keep_frames : optional, boolean
+        When True, the raw frames are also buffered so that save_gif, 
+        save_mp4, and save_frame remain available.  Every frame is then 
+        held twice, once as raw pixels and once as a surface.
+        default = False
+    """
+
+    def __init__(self,width,height,frame_rate,keep_frames=False):
+        super().__init__(width,height,frame_rate)
+        self.keep_frames = keep_frames
+        self.surfaces = []
+        self.screen = None
+        self.closed = False     # True once the user closes the window
+
+    def start(self):
+        """Open the preview window"""
+
+        if self.screen is None and not self.closed:
+            pg.display.init()
+            self.screen = pg.display.set_mode(self.frameSize)
+            pg.event.clear()
+
+        self.rendered = 0
+        self.dropped = 0
+        self._start_time = pg.time.get_ticks()
+        self._last_shown = None
+        self._last_title = self._start_time
+
+    def addFrame(self,frame):
+        """Convert the frame to a surface and show it if it is time"""
+
+        if self.keep_frames:
+            super().addFrame(frame)
+
+        height,width,_ = frame.shape
+        surface = pg.image.frombytes(frame.tobytes(),(width,height),'RGBA')
+        if self.screen is not None:
+            surface = surface.convert()
+        self.surfaces.append(surface)
+        self.rendered += 1
+
+        if self.screen is None:
+            return
+
+        now = pg.time.get_ticks()
+        frame_time = 1e3/self.frame_rate
+        if self._last_shown is None or now-self._last_shown >= frame_time:
+            self.screen.blit(surface,(0,0))
+            pg.display.flip()
+            self._last_shown = now
+        else:
+            self.dropped += 1
+
+        # Refresh the render rate in the title a couple of times a second
+        if now-self._last_title > 500:
+            fps = 1e3*self.rendered/max(1,now-self._start_time)
+            pg.display.set_caption(f"Rendering: {fps:.1f} fps, "
+                                   f"{self.rendered} frames, "
+                                   f"{self.dropped} skipped")
+            self._last_title = now
+
+        # Keep the window responsive
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                self.close()
+                self.closed = True
+                break
+
+    def end(self):
+        """Show the final frame"""
+        if self.screen is not None and len(self.surfaces) > 0:
+            self.screen.blit(self.surfaces[-1],(0,0))
+            pg.display.flip()
+
+    def play_movie(self,repeat=-1):
+        """Replay the pre-converted frames at the frame rate"""
+
+        if len(self.surfaces) == 0:
+            return
+
+        if self.screen is None:
+            pg.display.init()
+            self.screen = pg.display.set_mode(self.frameSize)
+        pg.display.set_caption("ananimlib")
+
+        clock = pg.time.Clock()
+        done = False
+        frameNum = 0
+
+        # Clear any queued events before starting the playback.
+        pg.event.clear()
+        while not done:
+            self.screen.blit(self.surfaces[frameNum],(0,0))
+            pg.display.flip()
+
+            frameNum += 1
+            if frameNum >= len(self.surfaces):
+                frameNum = 0
+                if repeat == 0:
+                    done = True
+                elif repeat > 0:
+                    repeat -= 1
+
+            # Hold each frame for one frame time
+            clock.tick(self.frame_rate)
+
+            # Handle Events.
+            for event in pg.event.get():
+
+                if event.type == pg.QUIT:
+                    done = True
+
+                if event.type == pg.KEYDOWN:
+                    if event.key == pg.K_ESCAPE:
+                        done = True
+
+        self.close()
+
+    def close(self):
+        """Close the preview window"""
+        if self.screen is not None:
+            pg.display.quit()
+            self.screen = None
+
+    def __del__(self):
+        self.close()
+
+
 class MP4Backend():
     """Use ffmpeg to write mp4s adapted from manimlib.scene.scenefilewriter
     """
@@ -279,3 +447,622 @@ class MP4Backend():
 
 
 
+
+
+class ImageSequenceBackend():
+    """Stream frames to a numbered sequence of PNG or lossless WebP images
+
+    Frames are handed to a pool of writer threads through a bounded queue so
+    that image compression overlaps with rendering while only a handful of
+    frames are held in memory.  addFrame blocks when the queue is full.
+
+    Files are named <outName>_<frame number><ext> where the frame number is
+    zero padded to the requested number of digits.  Numbering carries on 
+    across start/end cycles, so each call to Animate adds to the sequence
+    rather than overwriting it.  Set frame_number to restart the count.
+    """
+
+    def __init__(self,pixel_width,pixel_height,frame_rate,
+                 outName,outDir="./",image_format="png",compress_level=6,
+                 digits=5,num_threads=4,queue_size=8):
+        """Get ready to write images!
+
+        Parameters
+        ----------
+        pixel_width, pixel_height : Int
+            The dimensions of incoming frames in pixels.
+
+        frame_rate : Int
+            The frame rate of the animation in frames per second
+
+        outName : str
+            The base name of the output files.
+
+        outDir : optional, str
+            The output path.
+            default = './'
+
+        image_format : optional, str
+            Either 'png' or 'webp'.  WebP images are written losslessly.
+            default = 'png'
+
+        compress_level : optional, int
+            Compression effort from 0 (fastest) to 9 (smallest).  Used as the
+            zlib level for PNG and scaled to the lossless encoder effort
+            for WebP.
+            default = 6
+
+        digits : optional, int
+            The number of digits in the zero padded frame number.
+            default = 5
+
+        num_threads : optional, int
+            The number of writer threads.
+            default = 4
+
+        queue_size : optional, int
+            The maximum number of frames waiting to be written.
+            default = 8
+        """
+        image_format = image_format.lower()
+        if image_format not in ("png","webp"):
+            raise ValueError("image_format must be 'png' or 'webp'")
+
+        self.outName = outName
+        self.outDir = outDir
+        self.frameSize = np.array([pixel_width,pixel_height])
+        self.frame_rate = frame_rate
+        self.image_format = image_format
+        self.compress_level = compress_level
+        self.digits = digits
+        self.num_threads = num_threads
+        self.queue_size = queue_size
+
+        self._queue = None
+        self._threads = []
+        self._error = None
+        self.frame_number = 0
+
+    def start(self):
+        """Start the writer threads"""
+
+        if not os.path.exists(self.outDir):
+            os.makedirs(self.outDir)
+
+        self._error = None
+        self._queue = queue.Queue(self.queue_size)
+        self._threads = [threading.Thread(target=self._writer,daemon=True)
+                         for i in range(self.num_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def addFrame(self,frame):
+        """Queue the frame to be written"""
+
+        if self._queue is None:
+            self.start()
+        self._check_error()
+
+        self._queue.put((self.frame_number,frame))
+        self.frame_number += 1
+
+    def end(self):
+        """Wait for the queued frames to be written"""
+
+        if self._queue is None:
+            return
+
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        self._queue = None
+        self._threads = []
+        self._check_error()
+
+    def file_name(self,frame_number):
+        """The name of the image file for a frame"""
+
+        # Ensure that the outName doesn't have a path or extension
+        fname = os.path.split(self.outName)[1]
+        fname = os.path.splitext(fname)[0]
+        return os.path.join(self.outDir,
+            f"{fname}_{frame_number:0{self.digits}d}.{self.image_format}")
+
+    def save_image(self,frame,fname):
+        """Compress and write a single frame"""
+
+        image = Image.fromarray(frame)
+        if self.image_format == "png":
+            image.save(fname,"PNG",compress_level=self.compress_level)
+        else:
+            image.save(fname,"WEBP",lossless=True,
+                       quality=int(np.round(self.compress_level*100/9)))
+
+    def play_movie(self, *args):
+        pass
+
+    def _writer(self):
+        """Writer thread.  Save frames until a None arrives."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            # Keep draining the queue after an error so addFrame never blocks
+            if self._error is None:
+                try:
+                    frame_number, frame = item
+                    self.save_image(frame,self.file_name(frame_number))
+                except Exception as error:
+                    self._error = error
+
+    def _check_error(self):
+        """Raise any error encountered by a writer thread"""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+class FanOutBackend():
+    """Stream each frame to several backends during a single render pass
+
+    Every child backend is fed from its own consumer thread through its own
+    bounded queue, so a slow child (e.g. PNG compression) only stalls the 
+    renderer once its queue is full.  Each child can optionally receive a
+    downscaled copy of the frames and/or every nth frame.
+
+    Example: An MP4, a half size GIF preview, and a poster frame.
+    
+    >>> preview = al.Backend(0,0,0)
+    >>> al.engine.backend = al.FanOutBackend(
+    ...     [al.MP4Backend(0,0,0,"movie"), preview,
+    ...      al.ImageSequenceBackend(0,0,0,"poster")],
+    ...     downscale=[1,2,1], decimate=[1,2,1000])
+    >>> e = al.engine
+    >>> e.config_camera(e.width,e.ar,e.frame_rate,e.DPI)
+    >>> al.Animate(...)
+    >>> preview.save_gif("preview.gif")
+
+    Child frame sizes and frame rates follow those of the FanOutBackend.
+    The engine only sets them in config_camera, so call it after 
+    installing a new backend, as above, or give the first child the real 
+    size and rate.
+
+    Decimation counts frames across start/end cycles, so each call to 
+    Animate carries on where the last one stopped.
+
+    Parameters
+    ----------
+    backends : list of backends
+        The child backends
+
+    downscale : optional, list of int
+        Integer downscaling factor for each child.  Frames are reduced by
+        averaging factor x factor blocks of pixels.
+        default = None (no downscaling)
+
+    decimate : optional, list of int
+        Send every nth frame to each child.  The child's frame rate is
+        reduced accordingly.
+        default = None (every frame)
+
+    queue_size : optional, int
+        The maximum number of frames waiting for each child.
+        default = 8
+    """
+
+    def __init__(self,backends,downscale=None,decimate=None,queue_size=8):
+
+        self.backends = list(backends)
+        self.downscale = ([1]*len(self.backends) if downscale is None
+                          else [1 if d is None else int(d) for d in downscale])
+        self.decimate = ([1]*len(self.backends) if decimate is None
+                         else [1 if d is None else int(d) for d in decimate])
+        self.queue_size = queue_size
+
+        if (len(self.downscale) != len(self.backends) or
+            len(self.decimate) != len(self.backends)):
+            raise ValueError("downscale and decimate need one entry per "
+                             "backend")
+
+        self._queues = []
+        self._threads = []
+        self._errors = []
+        self.frame_number = 0
+
+        # Start with the frame size and rate of the first child
+        if len(self.backends) > 0:
+            self.frameSize = self.backends[0].frameSize
+            self.frame_rate = self.backends[0].frame_rate
+        else:
+            self._frameSize = np.zeros(2,dtype=int)
+            self._frame_rate = 0
+
+    @property
+    def frameSize(self):
+        return self._frameSize
+
+    @frameSize.setter
+    def frameSize(self,size):
+        self._frameSize = np.array(size,dtype=int)
+        for backend,factor in zip(self.backends,self.downscale):
+            backend.frameSize = self._frameSize//factor
+
+    @property
+    def frame_rate(self):
+        return self._frame_rate
+
+    @frame_rate.setter
+    def frame_rate(self,rate):
+        self._frame_rate = rate
+        for backend,n in zip(self.backends,self.decimate):
+            backend.frame_rate = rate/n
+
+    def start(self):
+        """Start the children and their consumer threads"""
+
+        self._errors = []
+        self._queues = [queue.Queue(self.queue_size) for b in self.backends]
+        self._threads = []
+        for backend,factor,q in zip(self.backends,self.downscale,
+                                    self._queues):
+            backend.start()
+            thread = threading.Thread(target=self._consumer,
+                                      args=(backend,factor,q),daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def addFrame(self,frame):
+        """Queue the frame for each child that wants it"""
+
+        if len(self._threads) == 0:
+            self.start()
+
+        # Shut the other children down cleanly before reporting a failure
+        if len(self._errors) > 0:
+            self._stop()
+            self._check_errors()
+
+        for n,q in zip(self.decimate,self._queues):
+            if self.frame_number % n == 0:
+                q.put(frame)
+        self.frame_number += 1
+
+    def end(self):
+        """Flush the queues and end every child"""
+
+        self._stop()
+        self._check_errors()
+
+    def play_movie(self,repeat=-1):
+        """Have the first child backend play the movie"""
+        if len(self.backends) > 0:
+            self.backends[0].play_movie(repeat)
+
+    def _consumer(self,backend,factor,q):
+        """Consumer thread. Feed frames to backend until None arrives."""
+        failed = False
+        while True:
+            frame = q.get()
+            if frame is None:
+                break
+
+            # Keep draining the queue after an error so addFrame never blocks
+            if not failed:
+                try:
+                    backend.addFrame(downscale_frame(frame,factor))
+                except Exception as error:
+                    self._errors.append(error)
+                    failed = True
+
+        if not failed:
+            try:
+                backend.end()
+            except Exception as error:
+                self._errors.append(error)
+
+    def _stop(self):
+        """Send the end marker to every consumer and wait for them"""
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        self._queues = []
+        self._threads = []
+
+    def _check_errors(self):
+        """Raise the first error encountered by a consumer thread"""
+        if len(self._errors) > 0:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+
+def downscale_frame(frame,factor):
+    """Shrink a frame by averaging blocks of factor x factor pixels
+
+    Parameters
+    ----------
+    frame : hxwxc ndarray of uint8
+        The frame to shrink
+
+    factor : int
+        The downscaling factor.  Rows and columns that do not fill a
+        complete block are dropped.
+
+    Returns
+    -------
+    (h//factor)x(w//factor)xc ndarray of uint8
+    """
+    if factor == 1:
+        return frame
+
+    h,w,c = frame.shape
+    h,w = h//factor, w//factor
+    blocks = frame[:h*factor,:w*factor].reshape(h,factor,w,factor,c)
+    total = blocks.sum(axis=(1,3),dtype=np.uint32)
+    return ((total + factor*factor//2)//(factor*factor)).astype(np.uint8)
+
+
+class GIFWriter():
+    """Write animated GIFs using a single global palette.
+
+    A palette of up to 256 colors is built once from a sample of the frames
+    using a vectorised median cut over a 15-bit color histogram.  A lookup
+    table then maps every 15-bit color to its nearest palette entry, so
+    converting a frame to palette indices is a single indexing operation.
+    Frames are converted in parallel chunks and streamed to the file one
+    chunk at a time.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the output file
+
+    frame_rate : float
+        The frame rate in frames per second.  The frame delay is rounded
+        to the nearest 1/100th of a second as required by the GIF format.
+
+    palette_samples : optional, int
+        The maximum number of frames sampled to build the palette.
+        default = 32
+
+    chunk_size : optional, int
+        The number of frames converted in parallel before being written.
+        default = 16
+
+    max_workers : optional, int
+        The number of conversion threads.
+        default = None (let ThreadPoolExecutor decide)
+
+    loop : optional, int
+        The number of times the animation repeats. 0 repeats forever.
+        default = 0
+
+    delta : optional, boolean
+        When True, only the rectangle enclosing the pixels that changed since
+        the previous frame is written and unchanged frames are merged into
+        the duration of the previous frame.
+        default = True
+    """
+
+    # Largest frame delay that fits in the GIF graphics control extension
+    max_delay = 0xFFFF
+
+    def __init__(self,fname,frame_rate,palette_samples=32,chunk_size=16,
+                 max_workers=None,loop=0,delta=True):
+
+        self.fname = fname
+        self.frame_rate = frame_rate
+        self.palette_samples = palette_samples
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.loop = loop
+        self.delta = delta
+
+        self.palette = None
+        self._lut = None
+
+    @property
+    def delay(self):
+        """The frame delay in 1/100ths of a second"""
+        return max(1,int(np.round(100/self.frame_rate)))
+
+    def write(self,frames):
+        """Write a sequence of RGB or RGBA frames to the GIF file
+
+        Parameters
+        ----------
+        frames : sequence of hxwx3 or hxwx4 ndarrays of uint8
+            The frames to write.
+        """
+        if len(frames) == 0:
+            return
+
+        if self.palette is None:
+            self.build_palette(frames)
+
+        ph,pw = frames[0].shape[:2]
+        with open(self.fname,'wb') as fp:
+            self._write_header(fp,pw,ph)
+
+            # The frame waiting for its duration to be known.
+            # In delta mode, the image, offset, and duration of the
+            # changed region.
+            pending  = None
+            previous = None
+
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                for start in range(0,len(frames),self.chunk_size):
+                    chunk = frames[start:start+self.chunk_size]
+                    for indices in executor.map(self.quantize,chunk):
+
+                        if not self.delta:
+                            self._write_frame(fp,indices)
+                            continue
+
+                        if previous is None:
+                            pending = [indices,(0,0),self.delay]
+                        else:
+                            box = _changed_box(previous,indices)
+                            if (box is None and
+                                pending[2]+self.delay <= self.max_delay):
+
+                                # Nothing changed.  Show the last frame longer
+                                pending[2] += self.delay
+                                continue
+
+                            self._write_frame(fp,*pending)
+                            if box is None:
+                                # Delay overflow. Restart with a 1x1 no-op
+                                box = (0,0,1,1)
+
+                            x0,y0,x1,y1 = box
+                            pending = [indices[y0:y1,x0:x1],(x0,y0),self.delay]
+
+                        previous = indices
+
+            if pending is not None:
+                self._write_frame(fp,*pending)
+
+            fp.write(b";")      # GIF trailer
+
+    def quantize(self,frame):
+        """Map an RGB(A) frame onto palette indices
+
+        Returns
+        -------
+        hxw ndarray of uint8
+            The index of the palette entry for each pixel
+        """
+        return self._lut[_color_keys(frame)]
+
+    def build_palette(self,frames):
+        """Build the global palette and color lookup table from the frames
+
+        Parameters
+        ----------
+        frames : sequence of hxwx3 or hxwx4 ndarrays of uint8
+            The frames to sample.
+        """
+
+        # Accumulate a histogram of 15-bit colors along with the sum of the
+        # true colors that fall into each bin
+        step = max(1,int(np.ceil(len(frames)/self.palette_samples)))
+        counts = np.zeros(1<<15)
+        sums = np.zeros((1<<15,3))
+        for frame in frames[::step]:
+            keys = _color_keys(frame).ravel()
+            counts += np.bincount(keys,minlength=1<<15)
+            for channel in range(3):
+                sums[:,channel] += np.bincount(
+                    keys,weights=frame[:,:,channel].ravel(),minlength=1<<15)
+
+        # Represent each occupied bin by the mean of its colors
+        used = np.nonzero(counts)[0]
+        weights = counts[used]
+        sums = sums[used]
+        colors = sums/weights[:,None]
+
+        # Median cut - Repeatedly split the box with the largest color range
+        # at the weighted median of its widest channel.
+        boxes = [np.arange(len(used))]
+        ranges = [np.ptp(colors,axis=0)]
+        while len(boxes) < 256:
+            widest = int(np.argmax([r.max() for r in ranges]))
+            if ranges[widest].max() == 0:
+                break
+            box = boxes.pop(widest)
+            channel = np.argmax(ranges.pop(widest))
+            box = box[np.argsort(colors[box,channel],kind='stable')]
+            cum = np.cumsum(weights[box])
+            split = int(np.searchsorted(cum,cum[-1]/2))
+            split = min(max(split,1),len(box)-1)
+            for half in (box[:split],box[split:]):
+                boxes.append(half)
+                ranges.append(np.ptp(colors[half],axis=0))
+
+        # Each entry is the mean of the true colors in its box
+        palette = np.array([sums[b].sum(axis=0)/weights[b].sum()
+                            for b in boxes])
+        self.palette = np.round(palette).astype(np.uint8)
+
+        # Nearest palette entry for every 15-bit color
+        centers = _key_colors(np.arange(1<<15)).astype(np.float32)
+        pal = self.palette.astype(np.float32)
+        dist = (pal**2).sum(axis=1)[None,:] - 2*centers.dot(pal.T)
+        lut = np.argmin(dist,axis=1).astype(np.uint8)
+
+        # Bins that appear in the frames map to the box that holds them
+        for index,box in enumerate(boxes):
+            lut[used[box]] = index
+        self._lut = lut
+
+    def _write_header(self,fp,width,height):
+        """Write the GIF header, global color table, and loop extension"""
+
+        palette = np.zeros((256,3),dtype=np.uint8)
+        palette[:len(self.palette)] = self.palette
+
+        fp.write(b"GIF89a" + struct.pack("<HHBBB",width,height,0xF7,0,0))
+        fp.write(palette.tobytes())
+        fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" +
+                 struct.pack("<H",self.loop) + b"\x00")
+
+    def _write_frame(self,fp,indices,offset=(0,0),duration=None,disposal=1):
+        """Encode a frame of palette indices into the file
+
+        Parameters
+        ----------
+        indices : hxw ndarray of uint8
+            The palette indices of the frame
+
+        offset : optional, tuple of int
+            The position of the frame's upper left corner on the canvas
+
+        duration : optional, int
+            The frame delay in 1/100ths of a second.
+            default = self.delay
+
+        disposal : optional, int
+            The GIF disposal method.
+            default = 1 (leave the frame in place for the next one)
+        """
+        if duration is None:
+            duration = self.delay
+        im = Image.fromarray(np.ascontiguousarray(indices))
+        for data in GifImagePlugin.getdata(im,offset,duration=duration*10,
+                                           disposal=disposal):
+            fp.write(data)
+
+
+def _color_keys(frame):
+    """Pack the RGB channels of a frame into 15-bit color keys"""
+    r = frame[:,:,0].astype(np.uint16)>>3
+    g = frame[:,:,1].astype(np.uint16)>>3
+    b = frame[:,:,2].astype(np.uint16)>>3
+    return (r<<10)|(g<<5)|b
+
+def _changed_box(previous,current):
+    """Find the rectangle enclosing the pixels that differ between frames
+
+    Returns
+    -------
+    x0,y0,x1,y1 : int
+        The left, top, right, and bottom (exclusive) edges of the rectangle
+        or None if the frames are identical.
+    """
+    diff = previous != current
+    rows = np.flatnonzero(diff.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(diff[rows[0]:rows[-1]+1].any(axis=0))
+    return cols[0],rows[0],cols[-1]+1,rows[-1]+1
+
+def _key_colors(keys):
+    """The RGB color represented by each 15-bit color key"""
+    rgb = np.stack(((keys>>10)&31,(keys>>5)&31,keys&31),axis=1)
+    return rgb*(255/31)
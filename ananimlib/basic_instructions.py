@@ -387,10 +387,13 @@ class Draw(al.Instruction):
         self.timing.update(dt)      # Update the timer
 
         if self.timing.time_left > 0:
-            # Split the bezier curve at the point indicated by timing.alpha
+            # Trim the bezier curve at the point indicated by timing.alpha
             # (or split any object that has implemented the split method)
-            t = self.original_data.D(self.timing.alpha)
-            left,_ = self.original_data.split(self.timing.alpha)
+            if isinstance(self.original_data,al.PolyBezier):
+                left = al.TrimmedPolyBezier(self.original_data,
+                                            self.timing.alpha)
+            else:
+                left,_ = self.original_data.split(self.timing.alpha)
 
             self.anobject.data = left
         else:
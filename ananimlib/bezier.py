@@ -19,10 +19,11 @@ import ananimlib as al
 import numpy as np
 import scipy.linalg as linalg
 
+import functools
 import re
 
 
-class PolyBezier():
+class PolyBezier(al.coordinates.Listenable):
     """Container for a connected  Cubic Poly-Bezier curve
 
     Contains a set of connected Bezier Curves, where the end point
@@ -34,30 +35,124 @@ class PolyBezier():
     num_segments : int
         The number of Bezier segments
 
+    arc_length_tol : float
+        The relative error tolerance for segment arc lengths
+
+    lookup_size : int
+        The number of intervals in each segment's distance lookup table
+
+    join_tol : float
+        The largest gap between the end of one segment and the start of
+        the next for which the two are still connected
+
+    compact : bool
+        Store the coefficients as an nx4x2 float32 array.  Only flat
+        curves can be stored compactly.  Adding points off the z = 0 plane
+        switches the curve back to full storage.
+
+    Objects that need to know when the curve changes register a method
+    with add_listener.
+
     """
 
-    def __init__(self,segments=None):
+    arc_length_tol = 1e-9
+    lookup_size = 64
+    join_tol = 1e-9
+
+    def __init__(self,segments=None,compact=False):
         """Initialize with an iterable of Bezier Segments
 
         Parameters
         ----------
         segments : List of BezierSegment
             Initial segments in the curve
+
+        compact : optional bool
+            Store the coefficients as 2d float32
+            default = False
         """
-        self._data = None
-        self._bounding_box = None
+        self._buffer = None
+        self._size = 0
+        self._compact = compact
+        self._invalidate()
 
         if segments is not None:
             for seg in segments:
                 self.add_segment(seg)
 
-        self._lengths = None
-        self._length = None
+    @property
+    def _data(self):
+        """The nx4x3 cube of Bezier coefficients
+
+        A view onto the filled part of a buffer which grows by doubling
+        its capacity so that appending segments is amortised O(1).  For
+        compact curves this is a new, read only, full precision copy on
+        every call, so changes must be made by setting _data or points.
+        """
+        if not self._compact or self._buffer is None:
+            return self._stored
+
+        data = _pad_coefficients(self._coefficients())
+        data.setflags(write=False)
+        return data
+
+    @_data.setter
+    def _data(self,val):
+        if val is None:
+            self._buffer = None
+            self._size = 0
+        elif self._compact and not np.any(val[...,2:]):
+            self._buffer = np.asarray(val[...,:2],dtype=np.float32)
+            self._size = len(val)
+        else:
+            self._compact = False
+            self._buffer = _pad_coefficients(val)
+            self._size = len(val)
+        self._invalidate()
+
+    @property
+    def _stored(self):
+        """The coefficients as stored, nx4x3 or compact nx4x2"""
+        if self._buffer is None:
+            return None
+        return self._buffer[:self._size]
+
+    def _coefficients(self,index=slice(None)):
+        """The stored coefficients of the selected segments in full precision
+
+        Compact coefficients are upcast into a temporary holding only the
+        selected segments.  Otherwise this is a view of the storage.
+        """
+        return np.asarray(self._stored[index],dtype=float)
+
+    def _evaluate(self,seg,t,deriv=0):
+        """bezier_points on the stored coefficients, as 3d points
+
+        Only the selected segments are gathered, and einsum upcasts 
+        compact coefficients to full precision.
+        """
+        return _pad_coefficients(bezier_points(self._stored,seg,t,deriv))
+
+    @property
+    def compact(self):
+        return self._compact
+
+    @compact.setter
+    def compact(self,val):
+        if val == self._compact:
+            return
+
+        data = self._data
+        if val and data is not None and np.any(data[:,:,2]):
+            raise ValueError("Only curves in the z = 0 plane can be " +
+                             "stored compactly")
+
+        self._compact = val
+        self._data = data
 
     @property
     def num_segments(self):
-        segs,points,dims = self._data.shape
-        return segs
+        return self._size
 
     @property
     def points(self):
@@ -89,8 +184,7 @@ class PolyBezier():
                              "dimensions.")
 
         self._data = val.reshape([int(rows/4),4,3])
-        self._bounding_box = None   # Invalidate the bounding box
-        self._lengths=None
+        self._invalidate()
 
 
     def shift(self,displacement):
@@ -109,16 +203,23 @@ class PolyBezier():
         # so that the desired displacment is in the same dimension
         # so that numpy's broadcasting rules work for us.
         displacement = np.array(displacement)
-        self._data = self._data + displacement[None,None,:]
-        self._bounding_box = self._bounding_box + displacement
+        bounding_box = self._bounding_box
+        if self._compact and not np.any(displacement[2:]):
+            self._data = self._stored + displacement[None,None,:2]
+        else:
+            self._data = self._data + displacement[None,None,:]
+
+        # Moving the curve moves its bounding box with it
+        if bounding_box is not None:
+            self._bounding_box = bounding_box + displacement
 
 
     def split(self,t):
         """Split the Bezier curve at t into two pieces.
 
         Let 0<=t<=1 so that it represents a portion of the entire shape.
-        split finds locates the correct BezierSegment and divides it
-        using BezierSegment.split
+        split locates the correct segment and divides it at the point
+        a proportional distance t along the curve.
 
         Parameters
         ----------
@@ -127,17 +228,19 @@ class PolyBezier():
         """
 
         seg,tseg = self.find_segment(t)
-
+        data = self._data
 
         # Split the segment
-        leftSeg,rightSeg = self[seg].split(tseg)
+        leftSeg,rightSeg = split_curves(data[seg],
+                                        self.segment_t(seg,tseg))
 
         # Build the left and right portions
-        left = PolyBezier(self[:seg])
+        left = PolyBezier()
+        left.extend(data[:seg])
         left.add_segment(leftSeg)
-        right = PolyBezier([rightSeg])
-        for s in self[(seg+1):]:
-            right.add_segment(s)
+        right = PolyBezier()
+        right.add_segment(rightSeg)
+        right.extend(data[(seg+1):])
 
         return left,right
 
@@ -145,10 +248,14 @@ class PolyBezier():
     def add_point(self,t):
         """Add an end point at t.  Creates another segment."""
 
-        left,right = self.split(t)
-        self.points = (left+right).points
-        self._bounding_box = None   # Invalidate the bounding box
-        self._lengths=None
+        seg,tseg = self.find_segment(t)
+        data = self._data
+        left,right = split_curves(data[seg],self.segment_t(seg,tseg))
+
+        # Replace the segment with its two halves
+        self._data = np.concatenate((data[:seg],
+                                     left[None,:,:],right[None,:,:],
+                                     data[(seg+1):]))
 
 
     
@@ -207,6 +314,77 @@ class PolyBezier():
 
         return 0.5*(tr+tl)
 
+    def T_array(self,p,param=0):
+        """Find t where the chosen coordinate reaches each value in p
+
+        The vectorised counterpart of T.  The segment holding each value
+        is found by binary search on the segment end points, and the
+        cubic for that segment is solved directly.
+
+        Behavior is undefined if the curve is not monotonic in the
+        chosen coordinate.
+
+        Parameters
+        ----------
+        p : ndarray of floats
+            The values of the coordinate
+
+        param : optional int
+            The coordinate, 0, 1, or 2 for x, y, or z
+            default = 0
+
+        Returns
+        -------
+        ndarray of floats
+            The curve parameters, 0<=t<=num_segments, as used by B
+        """
+        self._check_not_empty()
+        p = np.asarray(p,dtype=float)
+        extents = self.segment_extents(param)
+
+        # The curve may run either way along the coordinate
+        sign = 1.0 if extents[-1] >= extents[0] else -1.0
+        seg = np.searchsorted(sign*extents,sign*p)-1
+        seg = np.clip(seg,0,len(self)-1)
+
+        # Solve B(t) = p on each segment
+        c = _pad_coefficients(self._coefficients(seg))[:,:,param]
+        roots = cubic_roots(-c[:,0]+3*c[:,1]-3*c[:,2]+c[:,3],
+                            3*c[:,0]-6*c[:,1]+3*c[:,2],
+                            3*(c[:,1]-c[:,0]),
+                            c[:,0]-p)
+
+        # Take the first root on the segment, allowing for round off
+        eps = 1e-9
+        roots[~((roots >= -eps) & (roots <= 1+eps))] = np.nan
+        missing = np.all(np.isnan(roots),axis=1)
+        roots[missing,0] = np.where(sign*p[missing] <= sign*c[missing,0],
+                                    0.0,1.0)
+        t = np.clip(np.nanmin(roots,axis=1),0.0,1.0)
+
+        return seg+t
+
+    def segment_extents(self,param=0):
+        """The chosen coordinate at the start and end of every segment
+
+        Parameters
+        ----------
+        param : optional int
+            The coordinate, 0, 1, or 2 for x, y, or z
+            default = 0
+
+        Returns
+        -------
+        n+1 ndarray of floats
+            The coordinate at the start of the curve followed by its
+            value at the end of each segment
+        """
+        if param not in self._segment_extents:
+            data = self._stored
+            self._segment_extents[param] = np.concatenate(
+                (data[:1,0,param],data[:,3,param])).astype(float)
+        return self._segment_extents[param]
+
 
     def Bprime(self,t):
         """Calcuate the coordinates of the curve with 1<=t<=0"""
@@ -234,27 +412,188 @@ class PolyBezier():
         return self[seg].Bdprime(t)
 
     def D(self,t):
+        """Find the point a proportional distance t along the curve
+
+        Parameters
+        ----------
+        t : float, 0.0<=t<=1.0
+            The proportional distance along the entire curve
+
+        Returns
+        -------
+        D : array of floats
+            The coordinates of the point a proportinal distance t along
+            the curve
+        """
 
         seg,tseg = self.find_segment(t)
-        return self[seg].D(np.round(tseg,6))
+        return self[seg].B(self.segment_t(seg,tseg))
 
     def Dprime(self,t):
 
         seg,tseg = self.find_segment(t)
-        return self[seg].Dprime(np.round(tseg,6))
+        return self[seg].Bprime(self.segment_t(seg,tseg))
 
     def Ddprime(self,t):
 
         seg,tseg = self.find_segment(t)
-        return self[seg].Ddprime(np.round(tseg,6))
+        return self[seg].Bdprime(self.segment_t(seg,tseg))
+
+    def B_array(self,t):
+        """Calculate the coordinates of the curve for an array of t
+
+        Parameters
+        ----------
+        t : ndarray of floats
+            The Bezier parameters, 0<=t<=num_segments.  The integer part
+            selects the segment as in B.
+
+        Returns
+        -------
+        mx3 ndarray of floats
+            The coordinates of the curve at each t
+        """
+        seg,t = self._parameter_segments(t)
+        return self._evaluate(seg,t)
+
+    def Bprime_array(self,t):
+        """Calculate the first derivative of the curve for an array of t"""
+        seg,t = self._parameter_segments(t)
+        return self._evaluate(seg,t,deriv=1)
+
+    def Bdprime_array(self,t):
+        """Calculate the second derivative of the curve for an array of t"""
+        seg,t = self._parameter_segments(t)
+        return self._evaluate(seg,t,deriv=2)
+
+    def D_array(self,d):
+        """Find the points at proportional distances d along the curve
+
+        Parameters
+        ----------
+        d : ndarray of floats, 0.0<=d<=1.0
+            The proportional distances along the entire curve
+
+        Returns
+        -------
+        mx3 ndarray of floats
+            The coordinates of the curve at each distance
+        """
+        self._check_not_empty()
+        seg,tseg = self.find_segment(np.asarray(d,dtype=float))
+        return self._evaluate(seg,self.segment_t(seg,tseg))
+
+    def Dprime_array(self,d):
+        """First derivative at proportional distances d along the curve"""
+        self._check_not_empty()
+        seg,tseg = self.find_segment(np.asarray(d,dtype=float))
+        return self._evaluate(seg,self.segment_t(seg,tseg),deriv=1)
+
+    def Ddprime_array(self,d):
+        """Second derivative at proportional distances d along the curve"""
+        self._check_not_empty()
+        seg,tseg = self.find_segment(np.asarray(d,dtype=float))
+        return self._evaluate(seg,self.segment_t(seg,tseg),deriv=2)
+
+    def _parameter_segments(self,t):
+        """Split curve parameters into segment indices and segment t"""
+        self._check_not_empty()
+        t = np.asarray(t,dtype=float)
+        seg = np.clip(np.floor(t).astype(int),0,self.num_segments-1)
+        return seg,t-seg
+
+    def _check_not_empty(self):
+        """Raise a ValueError if the curve has no segments to evaluate"""
+        if len(self) == 0:
+            raise ValueError("Can't evaluate an empty PolyBezier")
+
+    def segment_t(self,seg,d):
+        """Convert a proportional distance along a segment into its t
+
+        Parameters
+        ----------
+        seg : int or ndarray of ints
+            The index of the segment
+
+        d : float or ndarray of floats, 0.0<=d<=1.0
+            The proportional distance along the segment
+
+        Returns
+        -------
+        t : float or ndarray of floats
+            The Bezier parameter of the segment
+        """
+        if np.ndim(seg) == 0:
+            dist = self.segment_distances(seg)
+            return np.interp(d*dist[-1],dist,self._lookup_t)
+
+        # Every row of the distance table is offset by the length of the
+        # curve before it so that one flat, sorted array covers all segments
+        if self._flat_distances is None:
+            dist = self.segment_distances(np.arange(len(self)))
+            self._segment_offsets = np.concatenate(
+                ([0.0],np.cumsum(dist[:-1,-1])))
+            self._flat_distances = (dist +
+                                    self._segment_offsets[:,None]).ravel()
+
+        n = self.lookup_size
+        dist = self._distances
+        target = d*dist[seg,-1]
+
+        # Binary search for the table interval, then interpolate
+        k = np.searchsorted(self._flat_distances,
+                            target+self._segment_offsets[seg],side='right')
+        k = np.clip(k-1-seg*(n+1),0,n-1)
+        lo = dist[seg,k]
+        hi = dist[seg,k+1]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            frac = np.where(hi > lo,(target-lo)/(hi-lo),0.0)
+
+        return (k+np.clip(frac,0.0,1.0))/n
+
+    def segment_distances(self,seg):
+        """Distance along a segment at lookup_size+1 evenly spaced t values
+
+        The distance tables for all segments are kept in a single 
+        n x lookup_size+1 array that survives until the points change.
+        Rows are filled in the first time they are needed.
+
+        Parameters
+        ----------
+        seg : int or ndarray of ints
+            The index (or indices) of the segments
+
+        Returns
+        -------
+        ndarray of floats
+            The distance table of the requested segment(s)
+        """
+
+        if self._distances is None:
+            self._distances = np.zeros((len(self),self.lookup_size+1))
+            self._have_distances = np.zeros(len(self),dtype=bool)
+            self._lookup_t = np.linspace(0,1,self.lookup_size+1)
+
+        # Integrate the missing tables, a block of segments at a time
+        missing = np.unique(np.asarray(seg)[~self._have_distances[seg]])
+        t = self._lookup_t
+        for start in range(0,len(missing),1024):
+            block = missing[start:start+1024]
+            self._distances[block,1:] = np.cumsum(
+                gauss_lengths(self._coefficients(block),t[:-1],t[1:]),
+                axis=1)
+            self._have_distances[block] = True
+
+        return self._distances[seg]
 
     @property
     def lengths(self):
         """The length of each segment"""
 
-        # Calculate the length of each segment
+        # Calculate the length of all segments at once
         if self._lengths is None:
-            self._lengths = np.array([seg.arc_length for seg in self])
+            self._lengths = arc_lengths(self._coefficients(),
+                                        self.arc_length_tol)
         
         return self._lengths
 
@@ -270,42 +609,42 @@ class PolyBezier():
 
         Parameters
         ----------
-        t : float
-            T
+        t : float or ndarray of floats
+            The proportional distance along the entire curve, 0<=t<=1
 
-        """
-
-        # Calculate the total length at each segment boundary
-        acc = 0
-        totals = []
-        for l in self.lengths:
-            totals.append(l+acc)
-            acc = totals[-1]
-        totals = np.array(totals)
+        Returns
+        -------
+        seg : int or ndarray of ints
+            The index of the segment containing each t
 
-        # Normalize the total length to to 1.0
-        dt = totals/totals[-1]
+        tseg : float or ndarray of floats
+            The proportional distance along each segment
+        """
 
-        # Find which segment
-        if t<1.0:
-            seg = np.where(dt>t)[0][0]
-        else:
-            seg = self.num_segments-1
+        # Find which segment with a binary search of the cumulative lengths
+        seg = np.searchsorted(self.cumulative_lengths,t,side='right')
+        seg = np.minimum(seg,self.num_segments-1)
 
         # Find proportion of the curve within the segment
-        if seg>0:
-            try:
-                tseg = (t*totals[-1]-totals[seg-1])/self._lengths[seg]
-            except:
-                print("dude!")
-#            tseg = (t-dt[seg-1])*totals[-1]/self._lengths[seg]
-        else:
-            tseg = t*totals[-1]/self._lengths[seg]
+        lengths = self.lengths[seg]
+        start = self.cumulative_lengths[seg]*self.length - lengths
+        with np.errstate(divide='ignore',invalid='ignore'):
+            tseg = np.where(lengths > 0,(t*self.length-start)/lengths,0.0)
+        tseg = np.clip(tseg,0.0,1.0)
+
+        if np.ndim(t) == 0:
+            return int(seg),float(tseg)
+        return seg,tseg
 
-        if seg == self.num_segments:
-                return self[-1].B(1.0)
+    @property
+    def cumulative_lengths(self):
+        """The length of the curve up to the end of each segment
 
-        return seg,tseg
+        Normalized so that the final entry is 1.0
+        """
+        if self._cumulative_lengths is None:
+            self._cumulative_lengths = np.cumsum(self.lengths)/self.length
+        return self._cumulative_lengths
 
     @property
     def bounding_box(self):
@@ -352,15 +691,334 @@ class PolyBezier():
             of a box whose sides either coincide with the curve's endpoints
             or are tangent to the curve's extremities on each axis.
         """
+        box = np.zeros((2,3))
         if len(self) > 0:
             # Get the bounding box for each segment
-            extrema = np.array([seg.bounding_box() for seg in self])
-            extrema = np.concatenate((extrema[:,0,:],extrema[:,1,:]))
+            boxes = self.segment_boxes
 
             # Return min and max across all segments
-            return np.array([extrema.min(axis=0),extrema.max(axis=0)])
+            dims = boxes.shape[2]
+            box[0,:dims] = boxes[:,0,:].min(axis=0)
+            box[1,:dims] = boxes[:,1,:].max(axis=0)
+
+        return box
+
+    def flatten(self,tolerance):
+        """Approximate the curve with straight lines
+
+        Each segment is divided into enough equal steps in t that the
+        polyline strays no more than tolerance from the curve.  The step
+        count comes from the bound on the second derivative of a cubic,
+        so every segment is sized at once.  Results are kept for each
+        tolerance until the curve changes.
+
+        Parameters
+        ----------
+        tolerance : float
+            The largest allowed distance between the polyline and the
+            curve, in the same units as the curve's points.  To flatten
+            to a pixel tolerance, divide it by the pixels per unit.
+
+        Returns
+        -------
+        list of mx3 ndarrays of floats
+            A polyline for each connected piece of the curve
+        """
+        if tolerance <= 0:
+            raise ValueError("tolerance must be greater than zero")
+
+        if tolerance in self._flattened:
+            return self._flattened[tolerance]
+
+        if len(self) == 0:
+            return []
+
+        data = self._data
+        starts = self.subpath_starts
+
+        # |B''| <= 6*max|p(i)-2p(i+1)+p(i+2)| and the chord of a step h
+        # strays at most h**2/8*|B''| from the curve
+        dd = np.max(np.linalg.norm(data[:,:-2]-2*data[:,1:-1]+data[:,2:],
+                                   axis=2),axis=1)
+        steps = np.maximum(np.ceil(np.sqrt(0.75*dd/tolerance)),1).astype(int)
+        steps[self.linear] = 1
+
+        # Each piece also needs its own starting point at t = 0
+        counts = steps + starts
+        seg = np.repeat(np.arange(len(data)),counts)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(counts)-counts,counts)
+        t = (k + 1 - starts[seg])/steps[seg]
+
+        points = bezier_points(data,seg,t)
+        first = (np.cumsum(counts)-counts)[starts.astype(bool)]
+
+        self._flattened[tolerance] = np.split(points,first[1:])
+        return self._flattened[tolerance]
+
+    def simplify(self,tol=1e-9,fit_tol=None):
+        """Reduce the number of segments without changing the shape
+
+        Segments of zero length are dropped and runs of joined straight
+        segments that continue in the same direction are merged into one.
+        If fit_tol is given, neighbouring curved segments are then merged
+        wherever a single cubic stays within fit_tol of both.
+
+        Parameters
+        ----------
+        tol : optional float
+            The distance within which points are treated as coincident or
+            collinear
+            default = 1e-9
+
+        fit_tol : optional float
+            The largest distance a merged cubic may stray from the two
+            segments it replaces.  Curved segments are not merged when
+            None.
+            default = None
+        """
+        if len(self) == 0:
+            return
+
+        data = self._data
+
+        # Drop segments whose points all coincide, keeping at least one
+        size = np.max(np.linalg.norm(data-data[:,:1],axis=2),axis=1)
+        if np.all(size <= tol):
+            data = data[:1]
         else:
-            return np.zeros((2,3))
+            data = data[size > tol]
+
+        # Merge straight segments that continue along the same line
+        linear = linear_segments(data,tol)
+        a = data[:-1,0]
+        b = data[:-1,3]
+        c = data[1:,3]
+        chord = np.linalg.norm(c-a,axis=1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            offset = np.linalg.norm(np.cross(b-a,c-a),axis=1)/chord
+
+        joinable = np.zeros(len(data),dtype=bool)
+        joinable[1:] = (linear[:-1] & linear[1:] &
+                        (np.linalg.norm(data[1:,0]-b,axis=1) <= self.join_tol) &
+                        (np.sum((b-a)*(c-b),axis=1) > 0) &
+                        (offset <= tol))
+
+        first = np.flatnonzero(~joinable)
+        last = np.append(first[1:],len(data))-1
+        merged = data[first].copy()
+        run = last > first
+        merged[run,3] = data[last[run],3]
+        merged[run,1] = 0.5*(merged[run,0]+merged[run,3])
+        merged[run,2] = merged[run,1]
+
+        if fit_tol is not None:
+            merged = _merge_cubics(merged,fit_tol,self.join_tol)
+
+        self._data = merged
+
+    @property
+    def linear(self):
+        """Mark the segments that are straight lines
+
+        Returns
+        -------
+        n ndarray of bools
+            True for each segment whose control points lie on its chord
+        """
+        if self._linear is None:
+            self._linear = linear_segments(self._stored,self._tolerance)
+        return self._linear
+
+    @property
+    def subpath_starts(self):
+        """Mark the segments that do not continue from the one before
+
+        Returns
+        -------
+        n ndarray of ints
+            1 for each segment that starts a new piece of the curve, 0
+            for those joined to the previous segment
+        """
+        if self._subpath_starts is None:
+            data = self._stored
+            starts = np.ones(len(self),dtype=int)
+            if len(self) > 1:
+                gap = np.linalg.norm(data[1:,0]-data[:-1,3],axis=1)
+                starts[1:] = gap > self._tolerance
+            self._subpath_starts = starts
+        return self._subpath_starts
+
+    @property
+    def _tolerance(self):
+        """join_tol, widened to the precision of compact storage"""
+        if not self._compact or len(self) == 0:
+            return self.join_tol
+        scale = np.max(np.abs(self._stored))
+        return max(self.join_tol,8*np.finfo(np.float32).eps*scale)
+
+    @property
+    def segment_boxes(self):
+        """The bounding box of each segment as an nx2xd ndarray"""
+        if self._segment_boxes is None:
+            self._segment_boxes = bounding_boxes(self._stored)
+        return self._segment_boxes
+
+    @property
+    def bvh(self):
+        """A bounding volume hierarchy over the segments, built on use"""
+        if self._bvh is None:
+            self._bvh = SegmentBVH(self.segment_boxes)
+        return self._bvh
+
+    def segments_in_box(self,box):
+        """Find the segments whose bounding boxes overlap a box
+
+        Parameters
+        ----------
+        box : 2xd array of floats
+            The lower left and upper right corners of the box
+
+        Returns
+        -------
+        ndarray of ints
+            The indices of the segments, in order
+        """
+        if len(self) == 0:
+            return np.zeros(0,dtype=int)
+
+        dims = self.segment_boxes.shape[2]
+        box = np.asarray(box,dtype=float)[:,:dims]
+
+        def overlaps(lower,upper):
+            return np.all((lower <= box[1]) & (upper >= box[0]),axis=-1)
+
+        return np.sort(self.bvh.query(overlaps))
+
+    def closest_point(self,p,samples=16,niter=4):
+        """Find the point on the curve closest to p
+
+        Segments that can't hold the closest point are pruned using the
+        bvh.  The remaining segments are sampled and the best sample of
+        each is refined with Newton's method, all at once.
+
+        Parameters
+        ----------
+        p : Vector
+            The point to approach
+
+        samples : optional int
+            The number of starting values of t tried on each segment
+            default = 16
+
+        niter : optional int
+            The number of Newton iterations
+            default = 4
+
+        Returns
+        -------
+        point : Vector
+            The closest point on the curve
+
+        t : float
+            The curve parameter of the closest point as used by B
+        """
+        self._check_not_empty()
+        p = np.asarray(al.Vector(p))
+        dims = self.segment_boxes.shape[2]
+        q = p[:dims]
+
+        def near(lower,upper):
+            # Distances to the nearest and farthest points of each box.
+            # Every box holds part of the curve, so nothing is closer
+            # than the smallest farthest distance.
+            nearest = np.linalg.norm(np.maximum(np.maximum(lower-q,q-upper),
+                                                0),axis=-1)
+            farthest = np.linalg.norm(np.maximum(np.abs(lower-q),
+                                                 np.abs(upper-q)),axis=-1)
+            return nearest <= farthest.min()
+
+        seg = self.bvh.query(near)
+
+        # Best sample on each candidate segment
+        t = np.linspace(0,1,samples)
+        pts = self._evaluate(np.repeat(seg,samples),np.tile(t,len(seg)))
+        dist = np.sum((pts.reshape(len(seg),samples,3)-p)**2,axis=2)
+        t = t[np.argmin(dist,axis=1)]
+
+        # Newton's method on (B-p).B' = 0
+        for _ in range(niter):
+            diff = self._evaluate(seg,t)-p
+            d1 = self._evaluate(seg,t,deriv=1)
+            d2 = self._evaluate(seg,t,deriv=2)
+            f = np.sum(diff*d1,axis=1)
+            fprime = np.sum(d1*d1+diff*d2,axis=1)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                step = np.where(fprime > 0,f/fprime,0.0)
+            t = np.clip(t-step,0.0,1.0)
+
+        points = self._evaluate(seg,t)
+        best = np.argmin(np.sum((points-p)**2,axis=1))
+
+        return al.Vector(points[best]),seg[best]+t[best]
+
+    def intersect(self,line):
+        """Find where a straight line crosses the curve in the x-y plane
+
+        Parameters
+        ----------
+        line : 2xd array of floats
+            The end points of the line
+
+        Returns
+        -------
+        points : mx3 ndarray of floats
+            The crossing points, ordered along the curve
+
+        t : m ndarray of floats
+            The curve parameters of the crossing points as used by B
+        """
+        line = np.asarray(line,dtype=float)
+        l0 = line[0,:2]
+        direction = line[1,:2]-l0
+        normal = np.array([-direction[1],direction[0]])
+
+        if len(self) == 0:
+            return np.zeros((0,3)),np.zeros(0)
+
+        def crosses(lower,upper):
+            # The box must overlap the line's box and have corners on
+            # both sides of the line
+            lo = lower[...,:2]
+            hi = upper[...,:2]
+            overlap = np.all((lo <= np.maximum(l0,l0+direction)) &
+                             (hi >= np.minimum(l0,l0+direction)),axis=-1)
+            side = [np.dot(np.stack((x,y),axis=-1)-l0,normal)
+                    for x in (lo[...,0],hi[...,0])
+                    for y in (lo[...,1],hi[...,1])]
+            return (overlap & (np.min(side,axis=0) <= 0) &
+                    (np.max(side,axis=0) >= 0))
+
+        seg = self.bvh.query(crosses)
+        data = self._coefficients(seg)
+
+        # The signed distance of each segment from the line is a cubic in t
+        p0,p1,p2,p3 = (np.dot(data[:,k,:2]-l0,normal) for k in range(4))
+        roots = cubic_roots(-p0+3*p1-3*p2+p3,3*p0-6*p1+3*p2,3*(p1-p0),p0)
+
+        seg = np.repeat(seg,3)
+        t = roots.ravel()
+        valid = (t >= 0) & (t <= 1)
+        seg = seg[valid]
+        t = t[valid]
+
+        # Keep the crossings that lie within the ends of the line
+        points = self._evaluate(seg,t)
+        s = np.dot(points[:,:2]-l0,direction)/np.dot(direction,direction)
+        inside = (s >= 0) & (s <= 1)
+
+        t = seg[inside]+t[inside]
+        order = np.argsort(t)
+        return points[inside][order],t[order]
 
     def add_segment(self,segment):
         """Add a Bezeir Segement to the curve
@@ -370,15 +1028,43 @@ class PolyBezier():
         segment : BezierSegment
             The Bezier Segment to add to the curve
         """
+        self.extend(segment[None,:])
 
-        if self._data is None:
-            self._data = segment[None,:]
+    def extend(self,segments):
+        """Add a set of Bezier segments to the end of the curve
+
+        Parameters
+        ----------
+        segments : nx4x3 ndarray of floats
+            The Bezier coefficients of the segments to add
+        """
+        segments = np.asarray(segments)
+
+        if self._compact and np.any(segments[...,2:]):
+            # Leaving the plane, switch to full storage
+            self.compact = False
+
+        if self._compact:
+            segments = segments[...,:2]
+            dtype = np.float32
         else:
-            self._data = np.concatenate((self._data,segment[None,:]))
+            segments = _pad_coefficients(segments)
+            dtype = (segments.dtype if self._buffer is None
+                     else np.result_type(self._buffer,segments))
 
-        # Invalidate the bounding box
-        self._bounding_box = None
-        self._length = None
+        n = len(segments)
+        size = self._size + n
+
+        if self._buffer is None or size > len(self._buffer):
+            # Out of room.  Double the capacity (at least) and move in.
+            capacity = max(size,2*self._size,4)
+            buffer = np.empty((capacity,)+segments.shape[1:],dtype=dtype)
+            buffer[:self._size] = self._stored
+            self._buffer = buffer
+
+        self._buffer[self._size:size] = segments
+        self._size = size
+        self._invalidate()
 
     def connect_linear(self,data,close=False):
         """Connect a set of points in 3-space with straight lines
@@ -396,7 +1082,7 @@ class PolyBezier():
         """
 
         # unpack the data into a ndarray
-        rawData = np.array([[c for c in p] for p in data])
+        rawData = _as_points(data)
         if close:
             # Copy the first point to the end of the list
             # Now here's a cryptic line of code, eh? I heart numpy.
@@ -422,10 +1108,7 @@ class PolyBezier():
         points[:,:2,2] = 0.5*(points[:,:2,3]+points[:,:2,0])        
 
         # Internal data structure is an (n-1)x4x3 cube
-        points = points.transpose([0,2,1])
-        for seg in points:
-            self.add_segment(seg)
-        self._bounding_box = None #self.calc_bounding_box()
+        self.extend(points.transpose([0,2,1]))
 
     def connect_smooth(self,data):
         """Smoothly connect a set of points in 3-space with Cubic Bezier segs
@@ -443,7 +1126,7 @@ class PolyBezier():
         """
 
         # unpack the data into a numpy matrix
-        rawData = np.array([[c for c in p] for p in data])
+        rawData = _as_points(data)
         n_rows,n_dims = rawData.shape
 
         #########################################
@@ -486,12 +1169,27 @@ class PolyBezier():
         points[:,:2,3] = rawData[1:,:2]
 
         # Internal data structure is an (n-1)x4x3 cube
-        points = points.transpose([0,2,1])
-        for seg in points:
-            self.add_segment(seg)
-        self._bounding_box = self.calc_bounding_box()
+        self.extend(points.transpose([0,2,1]))
 
 
+    def _invalidate(self):
+        """Discard everything calculated from the points"""
+        self._bounding_box = None
+        self._lengths = None
+        self._length = None
+        self._distances = None
+        self._flat_distances = None
+        self._cumulative_lengths = None
+        self._subpath_starts = None
+        self._linear = None
+        self._flattened = {}
+        self._cairo_path = None
+        self._segment_boxes = None
+        self._bvh = None
+        self._segment_extents = {}
+
+        self._notify_listeners()
+
     def __getitem__(self,index):
         """Return a single Bezier curve from the matrix
 
@@ -505,212 +1203,260 @@ class PolyBezier():
         bzSeg : BezierCurve
             The desired curve
         """
-        return BezierCurve(self._data[index])
+        return BezierCurve(_pad_coefficients(self._coefficients(index)))
 
     def __iter__(self):
-        if self._data is not None:
+        if self._buffer is not None:
             for seg in self._data:
                 yield BezierCurve(seg)
 
+    @property
+    def segment_blocks(self):
+        """The curve as a tuple of (data, linear, starts) blocks
+
+        data is an nx4x3 ndarray of Bezier coefficients, and linear and
+        starts are the matching rows of linear and subpath_starts.
+        Renderers walk the blocks in order rather than building a
+        BezierCurve for every segment.
+        """
+        if self._buffer is None:
+            return ()
+        return ((self._stored,self.linear,self.subpath_starts),)
+
+    def __getstate__(self):
+        # The renderer's cached cairo path can't be copied or pickled
+        state = super().__getstate__()
+        state['_cairo_path'] = None
+        return state
+
     def __add__(self,other):
         new_path = PolyBezier()
         new_path.points = np.append(self.points,other.points,axis=0)
         return new_path
 
     def __len__(self):
-        if self._data is None:
-            return 0
-        else:
-            n_curves, n_coeff, n_dims = self._data.shape
-        return n_curves
+        return self._size
 
 
-class SVGPolyBezier(PolyBezier):
-    """Generate a PolyBezier curve from an SVG path string
+class TrimmedPolyBezier():
+    """A view of the beginning of a PolyBezier
 
-    Adapted from Manimlib by Grant Sanderson
+    Holds the original curve and the proportional distance at which it
+    ends.  Only the segment that is cut is recalculated, the segments
+    before it are used directly from the original curve.  Anything else
+    asked of the view is answered by a PolyBezier built on first use.
+
+    Attributes
+    ----------
+    path : PolyBezier
+        The complete curve
+
+    end : float, 0.0<=end<=1.0
+        The proportional distance along path where the view ends
+
+    head : nx4x3 ndarray of floats
+        The coefficients of the segments that are kept whole
+
+    tail : 1x4x3 ndarray of floats
+        The coefficients of the part of the segment that is cut
     """
 
-    def __init__(self,path_string,):
-        super().__init__()
-        self.path_string = path_string
-        self.generate_points()
+    def __init__(self,path,end):
+        self.path = path
+        self.end = end
 
-    def get_path_commands(self):
-        result = [
-            "M",  # moveto
-            "L",  # lineto
-            "H",  # horizontal lineto
-            "V",  # vertical lineto
-            "C",  # curveto
-            "S",  # smooth curveto
-            "Q",  # quadratic Bezier curve
-            "T",  # smooth quadratic Bezier curveto
-            "A",  # elliptical Arc
-            "Z",  # closepath
-        ]
-        result += [s.lower() for s in result]
-        return result
+        seg,tseg = path.find_segment(end)
+        t = path.segment_t(seg,tseg)
 
-    def generate_points(self):
-        """Parse the SVG Path string and generate Bezier control points"""
+        tail,_ = split_curves(path._data[seg],t)
 
+        self.head = path._data[:seg]
+        self.tail = tail[None,:,:]
+        self._seg = seg
+        self._trimmed = None
 
-        # Extract command/coordinate pairs
-        pattern = "[%s]" % ("".join(self.get_path_commands()))
-        pairs = list(zip(
-            re.findall(pattern, self.path_string),
-            re.split(pattern, self.path_string)[1:]
-        ))
+    @property
+    def segment_blocks(self):
+        """The curve as a tuple of (data, linear, starts) blocks
 
-        # Execute the commands (create Bezier control points)
-        for command, coord_string in pairs:
-            self.handle_command(command, self.string_to_points(coord_string))
+        The whole segments reuse the original curve's linear and
+        subpath_starts.  Cutting a segment does not change either.
+        """
+        seg = self._seg
+        linear = self.path.linear
+        starts = self.path.subpath_starts
+        return ((self.head,linear[:seg],starts[:seg]),
+                (self.tail,linear[seg:seg+1],starts[seg:seg+1]))
 
-        # people treat y-coordinate differently
-        # self.about_point = [0,0]
-        # self.rotation_angle = np.pi
+    @property
+    def trimmed(self):
+        """The trimmed curve as a PolyBezier"""
+        if self._trimmed is None:
+            self._trimmed = PolyBezier()
+            self._trimmed._data = np.concatenate((self.head,self.tail))
+        return self._trimmed
 
-    def handle_command(self, command, coords):
+    @property
+    def _data(self):
+        return self.trimmed._data
 
-        isLower = command.islower()
-        command = command.upper()
-        new_points = np.array([]).reshape(0,3)
+    def __getattr__(self,name):
+        # Only reached for attributes not defined on the view
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.trimmed,name)
 
-        if command != "Z" and len(coords) == 0:
-            return
+    def __iter__(self):
+        for block in (self.head,self.tail):
+            for seg in block:
+                yield BezierCurve(seg)
 
-        # Flip the y axis
-        # For V command, only the y-coordinate is passed
-        # For all other commands, the second coordinate is y
-        if len(coords) > 0:
-            if command != "V":
-                coords[:,1] *= -1
-            else:
-                coords[:,0] *= -1
+    def __getitem__(self,index):
+        return self.trimmed[index]
 
-        # moveto
-        if command == "M":
-            if isLower:
-                coords[0] += self.current_position
+    def __len__(self):
+        return len(self.head)+1
 
-            self.current_position = coords[0] # Reset the current position
-            self.start_position = coords[0]   # Start a new path
 
-            # If there are any more coordinates on the list, assume that they
-            # are lineto commands
-            if isLower:
-                command = 'l'
-            else:
-                command = 'L'
-            self.handle_command(command, coords[1:])
-            return
+class SVGPolyBezier(PolyBezier):
+    """Generate a PolyBezier curve from an SVG path string
 
-        # lineto
-        elif command in ["L", "H", "V"]:  # lineto
-
-            # Horizontal Line, keep y-coordinate
-            if command == "H":
-                coords[:,1] = self.current_position[1]
-                if isLower:
-                    coords[:,0] += self.current_position[0]
-
-            # Vertical Line, keep x-coordinate
-            elif command == "V":
-                coords[:,1] = coords[:,0]
-                coords[:,0] = self.current_position[0]
-                if isLower:
-                    coords[:,1] += self.current_position[1]
-            elif isLower:
-                coords += self.current_position
-
-            # Connect points with a straight line
-            self.connect_linear(np.concatenate(
-                (self.current_position[None,:],coords))
-            )
-
-            # Update the current point
-            self.current_position = coords[-1]
-            return
+    Adapted from Manimlib by Grant Sanderson
 
-        # Cubic curveto - Add a Cubic Bezier
-        elif command == "C":  # curveto
-            if isLower:
-                coords += self.current_position
-                command = "c"
+    Parsed paths are shared through parse_svg_path's cache, so glyphs that
+    are used many times are only parsed once.
+    """
 
-            ## Add the new segment
-            coeff = np.concatenate((self.current_position[None,:],coords[:3,:]))
-            self.add_segment(coeff)
+    def __init__(self,path_string,):
+        super().__init__()
+        self.path_string = path_string
+        self.generate_points()
 
-            self.current_position = coords[-1]
+    def generate_points(self):
+        """Parse the SVG Path string and generate Bezier control points"""
+        data = parse_svg_path(self.path_string)
+        if len(data) > 0:
+            self.extend(data)
 
-            # Add any additional segments
-            self.handle_command(command, coords[3:])
-            return
+    def get_original_path_string(self):
+        return self.path_string
 
 
-        elif command == "S":  # smooth curveto
-            # Need the second control point from the last segment
-            prev_p2 = self[-1].p2
+_svg_tokens = re.compile(
+    r"([MmLlHhVvCcSsQqTtAaZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
 
-            # Reflect through the current point to calculate first control
-            # point for this segment
-            p1 = 2*self.current_position-prev_p2
+# The number of values each command takes for each segment it draws
+_svg_arity = {'M':2, 'L':2, 'H':1, 'V':1, 'C':6, 'S':4, 'Z':0}
 
-            # Assemble the coefficients and add the segment
-            coeff = np.concatenate(
-                (self.current_position[None,:], p1[None,:], coords[:2,:])
-            )
-            self.add_segment(coeff)
+@functools.lru_cache(maxsize=4096)
+def parse_svg_path(path_string):
+    """Convert an SVG path string into Bezier coefficients
 
-            self.current_position = coords[-1]
+    The string is tokenised in one pass and the segments are written
+    into a single preallocated array.  Straight lines get their control
+    points at the midpoint as in PolyBezier.connect_linear, and the y axis
+    is flipped.  Results are cached by path string, so the returned
+    array is read only.
 
-            # handle1 = points[-1] + (points[-1] - points[-2])
-            # new_points = np.append([handle1], new_points, axis=0)
-            return
+    Parameters
+    ----------
+    path_string : string
+        The d attribute of an SVG path element
 
-        # Quadratic curveto
-        elif command in ["Q", "T"]:
-            raise Exception("Time to implement Q and T in SVGBezier")
+    Returns
+    -------
+    nx4x3 ndarray of floats
+        The Bezier coefficients of the path
 
-        elif command == "A":  # elliptical Arc
-            raise Exception("Oh Dear... Elliptical Arc in SVGBezier")
+    Raises
+    ------
+        Exception for the unsupported Q, T, and A commands
+    """
+    tokens = _svg_tokens.findall(path_string)
 
-        elif command == "Z":  # closepath
+    # Every segment uses at least one number, except closepaths
+    out = np.zeros((len(tokens)+1,4,3))
+    n = 0
 
-            # Connect the current point with the first point in the path.
-            self.connect_linear(np.concatenate(
-                (self.current_position[None,:],self.start_position[None,:]))
-            )
-            self.current_position = self.start_position
-            self.start_position = None
+    x,y = 0.0,0.0           # The current point
+    sx,sy = 0.0,0.0         # Start of the current path
+    prev = None             # Second control point for smooth curveto
 
-            return
+    i = 0
+    while i < len(tokens):
+        command = tokens[i][0]
+        i += 1
+        if command == '':
+            raise ValueError("SVG path data must start with a command")
 
+        relative = command.islower()
+        command = command.upper()
 
-    def string_to_points(self, coord_string):
-        numbers = self.string_to_numbers(coord_string)
-        if len(numbers) % 2 == 1:
-            numbers.append(0)
-        num_points = len(numbers) // 2
-        result = np.zeros((num_points, 3))
-        result[:, :2] = np.array(numbers).reshape((num_points, 2))
-        return result
+        if command in ("Q","T"):
+            raise Exception("Time to implement Q and T in SVGBezier")
+        elif command == "A":
+            raise Exception("Oh Dear... Elliptical Arc in SVGBezier")
 
-    def string_to_numbers(self, num_string):
-        num_string = num_string.replace("-", ",-")
-        num_string = num_string.replace("e,-", "e-")
-        return [
-            float(s)
-            for s in re.split("[ ,]", num_string)
-            if s != ""
-        ]
+        # Gather the numbers that follow the command
+        j = i
+        while j < len(tokens) and tokens[j][0] == '':
+            j += 1
+        v = [float(tok[1]) for tok in tokens[i:j]]
+        i = j
+
+        if command == "Z":
+            # Connect the current point with the first point in the path
+            mx,my = 0.5*(x+sx),0.5*(y+sy)
+            out[n,:,:2] = ((x,y),(mx,my),(mx,my),(sx,sy))
+            n += 1
+            x,y = sx,sy
+            prev = None
+            continue
+
+        arity = _svg_arity[command]
+        for k in range(0,len(v)-arity+1,arity):
+            ox,oy = (x,y) if relative else (0.0,0.0)
+
+            if command == "M" and k == 0:
+                # Start a new path at this point
+                x,y = sx,sy = ox+v[k],oy+v[k+1]
+                prev = None
+                continue
+
+            if command == "C":
+                p1 = (ox+v[k],oy+v[k+1])
+                p2 = (ox+v[k+2],oy+v[k+3])
+                end = (ox+v[k+4],oy+v[k+5])
+                prev = p2
+
+            elif command == "S":
+                # Reflect the previous control point through the current
+                # point, or use the current point if there isn't one
+                p1 = (x,y) if prev is None else (2*x-prev[0],2*y-prev[1])
+                p2 = (ox+v[k],oy+v[k+1])
+                end = (ox+v[k+2],oy+v[k+3])
+                prev = p2
 
+            else:
+                if command == "H":
+                    end = (ox+v[k],y)
+                elif command == "V":
+                    end = (x,oy+v[k])
+                else:
+                    end = (ox+v[k],oy+v[k+1])
+                p1 = p2 = (0.5*(x+end[0]),0.5*(y+end[1]))
+                prev = None
 
-    def get_original_path_string(self):
-        return self.path_string
+            out[n,:,:2] = ((x,y),p1,p2,end)
+            n += 1
+            x,y = end
 
+    # SVG's y axis points down
+    out = out[:n]
+    out[:,:,1] *= -1
+    out.flags.writeable = False
+
+    return out
 
 
 class BezierCurve():
@@ -724,8 +1470,17 @@ class BezierCurve():
     ----------
     p0, p1, p2, p3: Vector
         The cubic Bezier coefficients.
+
+    arc_length_tol : float
+        The relative error tolerance for the arc length
+
+    lookup_size : int
+        The number of intervals in the distance lookup table
     """
 
+    arc_length_tol = 1e-9
+    lookup_size = 64
+
     def __init__(self,coefficients):
         """Get set up
 
@@ -792,30 +1547,7 @@ class BezierCurve():
             bounding box
         """
 
-        # The first derivative of B is quadratic in t, so calculate the quadratic
-        # coefficients
-        a0,b0,c0 = np.array([[-3.0,  9.0,-9.0, 3.0],
-                             [ 6.0,-12.0, 6.0, 0.0],
-                             [-3.0,  3.0, 0.0, 0.0]],
-                             dtype="cdouble").dot(self._coefficients)
-
-        t = []
-        for a,b,c in zip(a0,b0,c0):
-            if a != 0:
-                bac = b**2-4*a*c
-                t.append((1/(2*a))*(-b+np.sqrt(bac)))
-                t.append((1/(2*a))*(-b-np.sqrt(bac)))
-            elif b != 0:
-                t.append(-c/b)
-
-        # Consider only real roots in the range 0 <= t <= 1
-        t = np.array([t1.real for t1 in t if t1>=0 and t1<=1 and t1.imag==0])
-        extrema = self._coefficients[[0,3],:]
-        if len(t) > 0:
-            extrema = np.concatenate((extrema,self.B(t)),axis=0)
-
-        box = np.array([extrema.min(axis=0),extrema.max(axis=0)])
-        return box
+        return bounding_boxes(self._coefficients[None,:,:])[0]
 
 
     def split(self,t):
@@ -830,25 +1562,7 @@ class BezierCurve():
             The split point as a fraction of the total curve.  0<=t<=1
         """
 
-        left = []
-        right = []
-        def _split(t,points):
-            left.append(points[0])
-            right.insert(0,points[-1])
-            npoints,dims = points.shape
-            newpoints = []
-            if npoints == 1:
-                return points[0]
-            else:
-                for p0,p1 in zip(points[:-1,:],points[1:,:]):
-                    newpoints.append(t*p1+ (1-t)*p0)
-                return _split(t,np.array(newpoints))
-
-
-        _split(t,self._coefficients)
-
-        left = np.array(left)
-        right = np.array(right)
+        left,right = split_curves(self._coefficients,t)
 
         return BezierCurve(left),BezierCurve(right)
 
@@ -973,41 +1687,26 @@ class BezierCurve():
             the curve
         """
 
-        # Find the closest distance in the lookup table
-        ti = np.where(d<self.t_lookup[:,1])[0]
-        if len(ti) > 0:
-            # Get the associated t
-            t = self.t_lookup[ti[0],0]
-        else:
-            t=1.0
+        # Interpolate t from the lookup table
+        t = np.interp(d,self.t_lookup[:,1],self.t_lookup[:,0])
 
         # Call B to get the coordinates
         return self.B(t)
 
     def Dprime(self,d):
 
-        # Find the closest distance in the lookup table
-        ti = np.where(d<self.t_lookup[:,1])[0]
-        if len(ti) > 0:
-            # Get the associated t
-            t = self.t_lookup[ti[0],0]
-        else:
-            t=1.0
+        # Interpolate t from the lookup table
+        t = np.interp(d,self.t_lookup[:,1],self.t_lookup[:,0])
 
-        # Call B to get the coordinates
+        # Call Bprime to get the coordinates
         return self.Bprime(t)
 
     def Ddprime(self,d):
 
-        # Find the closest distance in the lookup table
-        ti = np.where(d<self.t_lookup[:,1])[0]
-        if len(ti) > 0:
-            # Get the associated t
-            t = self.t_lookup[ti[0],0]
-        else:
-            t=1.0
+        # Interpolate t from the lookup table
+        t = np.interp(d,self.t_lookup[:,1],self.t_lookup[:,0])
 
-        # Call B to get the coordinates
+        # Call Bdprime to get the coordinates
         return self.Bdprime(t)
 
     @property
@@ -1016,37 +1715,540 @@ class BezierCurve():
 
         if self._t_lookup is None or self._distances is None:
             self._t_lookup = np.zeros((len(self.distances),2))
-            self._t_lookup[:,1] = self.distances/self.arc_length
-            self._t_lookup[:,0] = t = np.linspace(0,1,len(self.distances))
+            self._t_lookup[:,1] = self.distances/self.distances[-1]
+            self._t_lookup[:,0] = np.linspace(0,1,len(self.distances))
 
         return self._t_lookup
 
 
     @property
     def distances(self):
-        """Approximate distance along the curve at a discrete set of t values"""
+        """Distance along the curve at lookup_size+1 evenly spaced t values"""
 
         if self._distances is None:
 
-            # Sample the curve at a bunch of points
-            dist = self.B(np.linspace(0,1,30000))
-
-            # Calculate the pair-wise distance between points
-            diff = dist[:-1]-dist[1:]
-            dist = np.sum(diff**2,axis=1)**0.5
-
-            # Accumulate distances
-            self._distances = np.zeros(len(dist)+1)
-            for i,l in enumerate(dist,1):
-                self._distances[i] = self._distances[i-1] + l
+            # Integrate the length of each interval and accumulate
+            t = np.linspace(0,1,self.lookup_size+1)
+            dist = gauss_lengths(self._coefficients[None,:,:],t[:-1],t[1:])
+            self._distances = np.zeros(len(t))
+            self._distances[1:] = np.cumsum(dist[0])
 
         return self._distances
 
     @property
     def arc_length(self):
-        return self.distances[-1]
+        return arc_lengths(self._coefficients[None,:,:],
+                           self.arc_length_tol)[0]
 
     def __getitem__(self,index):
         return self._coefficients[index]
 
 
+class SegmentBVH():
+    """Bounding volume hierarchy over a set of boxes
+
+    The boxes are sorted along a Morton curve through their centres and
+    grouped into leaves of leaf_size boxes.  Each level of the tree holds
+    the boxes enclosing pairs of nodes from the level below.  Queries
+    visit a whole level at once.
+
+    Attributes
+    ----------
+    leaf_size : int
+        The number of boxes in each leaf
+
+    levels : list of (lower, upper) tuples of mxd ndarrays
+        The node boxes of each level from the root down to the leaves
+
+    boxes : (lower, upper) tuple of nxd ndarrays
+        The boxes themselves in Morton order
+    """
+
+    leaf_size = 8
+
+    def __init__(self,boxes):
+        """Build the hierarchy
+
+        Parameters
+        ----------
+        boxes : nx2xd ndarray of floats
+            The lower left and upper right corners of each box
+        """
+        boxes = np.asarray(boxes,dtype=float)
+        n,_,dims = boxes.shape
+        self.size = n
+
+        # Sort the boxes along a Morton curve through their centres
+        centers = boxes.mean(axis=1)
+        lo = centers.min(axis=0)
+        span = np.maximum(centers.max(axis=0)-lo,1e-300)
+        cells = ((centers-lo)/span*1023).astype(np.int64)
+        code = np.zeros(n,dtype=np.int64)
+        for bit in range(10):
+            for d in range(dims):
+                code |= ((cells[:,d] >> bit) & 1) << (bit*dims+d)
+        self.order = np.argsort(code,kind='stable')
+
+        # Leaves, padded to a power of two with empty boxes
+        num_leaves = max(1,-(-n//self.leaf_size))
+        num_leaves = 1 << int(np.ceil(np.log2(num_leaves)))
+        lower = np.full((num_leaves*self.leaf_size,dims),np.inf)
+        upper = np.full((num_leaves*self.leaf_size,dims),-np.inf)
+        lower[:n] = boxes[self.order,0]
+        upper[:n] = boxes[self.order,1]
+        self.boxes = (lower[:n],upper[:n])
+        lower = lower.reshape(num_leaves,self.leaf_size,dims).min(axis=1)
+        upper = upper.reshape(num_leaves,self.leaf_size,dims).max(axis=1)
+
+        self.levels = [(lower,upper)]
+        while len(lower) > 1:
+            lower = np.minimum(lower[0::2],lower[1::2])
+            upper = np.maximum(upper[0::2],upper[1::2])
+            self.levels.insert(0,(lower,upper))
+
+    def query(self,test):
+        """Find the boxes that pass a test
+
+        Parameters
+        ----------
+        test : function
+            Called with the (lower, upper) corners of a set of boxes and
+            returns a boolean mask of those worth visiting.  It must pass
+            every box that encloses one that passes.
+
+        Returns
+        -------
+        ndarray of ints
+            The indices of the boxes that pass
+        """
+        nodes = np.zeros(1,dtype=int)
+        for level,(lower,upper) in enumerate(self.levels):
+            empty = np.isinf(lower[nodes,0])
+            nodes = nodes[~empty]
+            nodes = nodes[test(lower[nodes],upper[nodes])]
+            if level < len(self.levels)-1:
+                nodes = np.stack((2*nodes,2*nodes+1),axis=1).ravel()
+
+        # Test the boxes within the leaves that are left
+        index = (nodes[:,None]*self.leaf_size +
+                 np.arange(self.leaf_size)).ravel()
+        index = index[index < self.size]
+        lower,upper = self.boxes
+        index = index[test(lower[index],upper[index])]
+
+        return self.order[index]
+
+
+def _pad_coefficients(data):
+    """Give 2d Bezier coefficients or points a zero z coordinate"""
+    if data.shape[-1] == 2:
+        data = np.concatenate((data,np.zeros(data.shape[:-1]+(1,))),axis=-1)
+    return data
+
+def _as_points(data):
+    """Unpack an iterable of points into an nxd ndarray"""
+    try:
+        rawData = np.asarray(data,dtype=float)
+    except ValueError:
+        rawData = None
+
+    if rawData is None or rawData.ndim != 2:
+        # Ragged input, fall back to unpacking point by point
+        rawData = np.array([[c for c in p] for p in data])
+
+    return rawData
+
+
+# Gauss-Legendre nodes and weights on [-1,1] for arc length integration
+_gauss_nodes, _gauss_weights = np.polynomial.legendre.leggauss(8)
+
+def speed(data,t):
+    """Calculate |dB/dt| for a set of Bezier segments
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    t : nxm or m ndarray of floats
+        The Bezier parameters at which to evaluate each segment
+
+    Returns
+    -------
+    nxm ndarray of floats
+        The magnitude of the first derivative
+    """
+
+    # The derivative is a quadratic Bezier curve with these coefficients
+    d = 3*(data[:,1:,:]-data[:,:-1,:])
+
+    t = np.broadcast_to(t,(len(data),np.shape(t)[-1]))[:,:,None]
+    mt = 1-t
+    v = (d[:,None,0,:]*mt**2 + d[:,None,1,:]*(2*mt*t) + d[:,None,2,:]*t**2)
+    return np.sqrt(np.sum(v**2,axis=2))
+
+def split_curves(data,t):
+    """Split a set of Bezier curves with de Casteljau's algorithm
+
+    Parameters
+    ----------
+    data : ...x4xd ndarray of floats
+        The Bezier coefficients of the curves
+
+    t : float or ndarray of floats, 0<=t<=1
+        The split points.  Broadcast against the leading dimensions of
+        data so that one curve may be split at many t, or many curves
+        each at their own t.
+
+    Returns
+    -------
+    left, right : ...x4xd ndarrays of floats
+        The coefficients of the curves before and after each split point
+    """
+    data = np.asarray(data,dtype=float)
+    t = np.asarray(t,dtype=float)[...,None]
+    p0,p1,p2,p3 = (data[...,k,:] for k in range(4))
+
+    p01 = p0 + t*(p1-p0)
+    p12 = p1 + t*(p2-p1)
+    p23 = p2 + t*(p3-p2)
+    p012 = p01 + t*(p12-p01)
+    p123 = p12 + t*(p23-p12)
+    p0123 = p012 + t*(p123-p012)
+
+    p0,p3 = np.broadcast_arrays(p0,p3,p0123)[:2]
+    left = np.stack((p0,p01,p012,p0123),axis=-2)
+    right = np.stack((p0123,p123,p23,p3),axis=-2)
+
+    return left,right
+
+def linear_segments(data,tol=1e-9):
+    """Find the Bezier segments that are straight lines
+
+    A segment is straight when both control points lie on the chord
+    between its end points.
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    tol : optional float
+        The largest distance of a control point from the chord
+        default = 1e-9
+
+    Returns
+    -------
+    n ndarray of bools
+        True for each straight segment
+    """
+    data = np.asarray(data,dtype=float)
+    chord = data[:,3]-data[:,0]
+    length2 = np.sum(chord**2,axis=1)[:,None]
+    ctrl = data[:,1:3]-data[:,:1]
+
+    # Position of each control point along the chord, and its distance
+    # from the chord
+    with np.errstate(divide='ignore',invalid='ignore'):
+        u = np.where(length2 > 0,
+                     np.sum(ctrl*chord[:,None],axis=2)/length2,0.0)
+    dist = np.linalg.norm(ctrl-u[...,None]*chord[:,None],axis=2)
+
+    return np.all((dist <= tol) & (u >= -tol) & (u <= 1+tol),axis=1)
+
+def _merge_cubics(data,tol,join_tol,samples=8):
+    """Replace pairs of joined cubics with one cubic where it fits
+
+    The merged cubic keeps the outer end points and end tangents of the
+    pair.  The lengths of its control arms are fit by least squares to
+    points sampled along the pair, and the fit is accepted when every
+    sample lies within tol of the cubic.  Passes repeat until no more
+    pairs can be merged.
+    """
+    u = (np.arange(samples)+0.5)/samples
+    basis = np.array([(1-u)**3,3*(1-u)**2*u,3*(1-u)*u**2,u**3]).T
+
+    while len(data) > 1:
+        left = data[:-1]
+        right = data[1:]
+        joined = np.linalg.norm(right[:,0]-left[:,3],axis=1) <= join_tol
+
+        # Sample both segments and parametrise by chord length
+        pts = np.concatenate((basis.dot(left).transpose(1,0,2),
+                              basis.dot(right).transpose(1,0,2)),axis=1)
+        ends = np.concatenate((left[:,:1],pts,right[:,3:]),axis=1)
+        steps = np.linalg.norm(np.diff(ends,axis=1),axis=2)
+        s = np.cumsum(steps,axis=1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            s = s[:,:-1]/s[:,-1:]
+        s = np.nan_to_num(s)[...,None]
+
+        p0 = left[:,0]
+        p3 = right[:,3]
+        t0 = _end_tangent(left)
+        t1 = -_end_tangent(right[:,::-1])
+
+        # Solve for the arm lengths a and b in
+        # B(s) = p0*(B0+B1) + p3*(B2+B3) + a*B1*t0 - b*B2*t1
+        b1 = 3*(1-s)**2*s
+        b2 = 3*(1-s)*s**2
+        rhs = pts - ((1-s)**3+b1)*p0[:,None] - (b2+s**3)*p3[:,None]
+        c0 = b1*t0[:,None]
+        c1 = -b2*t1[:,None]
+        m00 = np.sum(c0*c0,axis=(1,2))
+        m01 = np.sum(c0*c1,axis=(1,2))
+        m11 = np.sum(c1*c1,axis=(1,2))
+        r0 = np.sum(c0*rhs,axis=(1,2))
+        r1 = np.sum(c1*rhs,axis=(1,2))
+        det = m00*m11-m01**2
+        with np.errstate(divide='ignore',invalid='ignore'):
+            arm0 = (m11*r0-m01*r1)/det
+            arm1 = (m00*r1-m01*r0)/det
+
+        fit = np.stack((p0,p0+arm0[:,None]*t0,p3-arm1[:,None]*t1,p3),axis=1)
+        err = np.linalg.norm(rhs-arm0[:,None,None]*c0-arm1[:,None,None]*c1,
+                             axis=2).max(axis=1)
+        ok = joined & (det > 0) & (err <= tol)
+
+        # Merge non-overlapping pairs, taking them from the front
+        ok = np.flatnonzero(ok)
+        if len(ok) == 0:
+            break
+        chosen = [ok[0]]
+        for i in ok[1:]:
+            if i > chosen[-1]+1:
+                chosen.append(i)
+        chosen = np.array(chosen)
+
+        keep = np.ones(len(data),dtype=bool)
+        keep[chosen+1] = False
+        data = data.copy()
+        data[chosen] = fit[chosen]
+        data = data[keep]
+
+    return data
+
+def _end_tangent(data):
+    """Unit tangent at the start of each segment"""
+    tangent = data[:,1]-data[:,0]
+    for k in (2,3):
+        flat = np.linalg.norm(tangent,axis=1) == 0
+        tangent[flat] = data[flat,k]-data[flat,0]
+    norm = np.linalg.norm(tangent,axis=1)[:,None]
+    return np.divide(tangent,norm,out=np.zeros_like(tangent),where=norm > 0)
+
+def bezier_points(data,seg,t,deriv=0):
+    """Evaluate many Bezier segments at once
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    seg : m ndarray of ints
+        The index of the segment to evaluate for each t
+
+    t : m ndarray of floats
+        The Bezier parameters, 0<=t<=1
+
+    deriv : optional int
+        The desired derivative, 0, 1, or 2
+        default = 0 (no derivative)
+
+    Returns
+    -------
+    mxd ndarray of floats
+        The coordinates (or derivatives) at each t
+    """
+    t = np.asarray(t,dtype=float)
+    mt = 1-t
+
+    # The Bernstein basis (or its derivatives) for each t
+    if deriv == 0:
+        basis = [mt**3, 3*mt**2*t, 3*mt*t**2, t**3]
+    elif deriv == 1:
+        basis = [-3*mt**2, 3*mt**2-6*mt*t, 6*mt*t-3*t**2, 3*t**2]
+    elif deriv == 2:
+        basis = [6*mt, 6*t-12*mt, 6*mt-12*t, 6*t]
+    else:
+        raise ValueError("deriv must be 0, 1, or 2")
+
+    return np.einsum('km,mkd->md',np.array(basis),data[seg])
+
+def bounding_boxes(data):
+    """Calculate the bounding box of each of a set of Bezier segments
+
+    The extremities of a cubic on each axis lie either at its end points or
+    where dB/dt = 0.  dB/dt is quadratic in t, so the roots are found for
+    every segment and every axis at once.
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    Returns
+    -------
+    nx2xd ndarray of floats
+        The lower left and upper right corners of each segment's box
+    """
+    data = np.asarray(data)
+    data = data.astype(np.result_type(data,np.float32),copy=False)
+    p0,p1,p2,p3 = data[:,0],data[:,1],data[:,2],data[:,3]
+
+    # Quadratic coefficients of dB/dt (divided by 3)
+    a = -p0 + 3*p1 - 3*p2 + p3
+    b = 2*(p0 - 2*p1 + p2)
+    c = p1 - p0
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        sq = np.sqrt(b**2-4*a*c)
+        quadratic = a != 0
+        t1 = np.where(quadratic,(-b+sq)/(2*a),-c/b)
+        t2 = np.where(quadratic,(-b-sq)/(2*a),np.nan)
+
+    # Evaluate each axis at its own roots, keeping the real ones in [0,1]
+    t = np.stack((t1,t2))
+    t = np.where((t >= 0) & (t <= 1),t,np.nan)
+    mt = 1-t
+    values = mt**3*p0 + 3*mt**2*t*p1 + 3*mt*t**2*p2 + t**3*p3
+
+    lower = np.minimum(p0,p3)
+    upper = np.maximum(p0,p3)
+    lower = np.fmin(lower,np.fmin(values[0],values[1]))
+    upper = np.fmax(upper,np.fmax(values[0],values[1]))
+
+    return np.stack((lower,upper),axis=1)
+
+def cubic_roots(a,b,c,d):
+    """Find the real roots of a*t**3 + b*t**2 + c*t + d for many cubics
+
+    Uses Cardano's formula or its trigonometric form depending on the
+    discriminant, falling back to the quadratic and linear formulas when
+    the leading coefficients vanish.  The roots are polished with a
+    Newton step.
+
+    Parameters
+    ----------
+    a,b,c,d : ndarrays of floats
+        The polynomial coefficients
+
+    Returns
+    -------
+    ...x3 ndarray of floats
+        The real roots of each cubic, padded with NaN
+    """
+    a,b,c,d = np.broadcast_arrays(*(np.asarray(x,dtype=float)
+                                    for x in (a,b,c,d)))
+    roots = np.full(a.shape+(3,),np.nan)
+    scale = np.max(np.abs([a,b,c,d]),axis=0)
+
+    with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+        cubic = np.abs(a) > 1e-10*scale
+        quadratic = ~cubic & (np.abs(b) > 1e-10*scale)
+        linear = ~cubic & ~quadratic & (np.abs(c) > 0)
+
+        # Depressed cubic x**3 + p*x + q with t = x - b/(3a)
+        A,B,C,D = a[cubic],b[cubic],c[cubic],d[cubic]
+        shift = -B/(3*A)
+        p = (3*A*C-B**2)/(3*A**2)
+        q = (2*B**3-9*A*B*C+27*A**2*D)/(27*A**3)
+        disc = (q/2)**2+(p/3)**3
+
+        r = np.zeros((len(A),3))*np.nan
+        one = disc >= 0
+        sq = np.sqrt(disc[one])
+        r[one,0] = np.cbrt(-q[one]/2+sq)+np.cbrt(-q[one]/2-sq)
+
+        three = ~one
+        m = 2*np.sqrt(-p[three]/3)
+        phi = np.arccos(np.clip(3*q[three]/(p[three]*m),-1,1))/3
+        for k in range(3):
+            r[three,k] = m*np.cos(phi-2*np.pi*k/3)
+        roots[cubic] = r+shift[:,None]
+
+        # Quadratic and linear
+        B,C,D = b[quadratic],c[quadratic],d[quadratic]
+        sq = np.sqrt(C**2-4*B*D)
+        roots[quadratic,0] = (-C+sq)/(2*B)
+        roots[quadratic,1] = (-C-sq)/(2*B)
+        roots[linear,0] = -d[linear]/c[linear]
+
+        # Polish
+        t = roots
+        f = ((a[...,None]*t+b[...,None])*t+c[...,None])*t+d[...,None]
+        fp = (3*a[...,None]*t+2*b[...,None])*t+c[...,None]
+        roots = np.where(fp != 0,t-f/fp,t)
+
+    return roots
+
+def gauss_lengths(data,a,b):
+    """Integrate the arc length of Bezier segments over intervals of t
+
+    Uses an 8 point Gauss-Legendre quadrature on each interval.
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    a, b : m ndarrays of floats
+        The lower and upper bounds of the m intervals
+
+    Returns
+    -------
+    nxm ndarray of floats
+        The length of each segment over each interval
+    """
+    a = np.asarray(a,dtype=float)
+    b = np.asarray(b,dtype=float)
+    half = 0.5*(b-a)
+
+    # Quadrature nodes for every interval: m x order
+    t = (a+half)[:,None] + half[:,None]*_gauss_nodes[None,:]
+    s = speed(data,t.ravel()).reshape(len(data),len(a),len(_gauss_nodes))
+
+    return np.sum(s*_gauss_weights,axis=2)*half
+
+def arc_lengths(data,tol=1e-9,max_level=12):
+    """Calculate the arc length of a set of Bezier segments
+
+    Each segment is integrated with composite Gauss-Legendre quadrature.
+    The number of panels is doubled for the segments whose length changes
+    by more than tol (relative) until all segments converge.
+
+    Parameters
+    ----------
+    data : nx4xd ndarray of floats
+        The Bezier coefficients of n segments
+
+    tol : optional float
+        The relative error tolerance
+        default = 1e-9
+
+    max_level : optional int
+        Stop refining after 2**max_level panels
+        default = 12
+
+    Returns
+    -------
+    n ndarray of floats
+        The length of each segment
+    """
+    if data is None or len(data) == 0:
+        return np.zeros(0)
+
+    lengths = gauss_lengths(data,[0.0],[1.0])[:,0]
+    todo = np.arange(len(data))
+
+    for level in range(1,max_level+1):
+        panels = np.linspace(0,1,2**level+1)
+        refined = np.sum(gauss_lengths(data[todo],panels[:-1],panels[1:]),
+                         axis=1)
+        converged = np.abs(refined-lengths[todo]) <= tol*np.abs(refined)
+        lengths[todo] = refined
+        todo = todo[~converged]
+        if len(todo) == 0:
+            break
+
+    return lengths
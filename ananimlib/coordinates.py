@@ -8,10 +8,53 @@ Created on Wed Dec 11 15:19:42 2019
 """
 
 import math
+import weakref
 import numpy as np
-import scipy.linalg
 
-class Coordinates():
+class Listenable():
+    """Mixin to tell other objects when this one changes
+
+    Listeners are bound methods, held by weak reference so that they don't 
+    keep their objects alive.  They are not copied or pickled along with 
+    the object.
+    """
+
+    _listeners = ()
+
+    def add_listener(self,method):
+        """Call method, with no arguments, whenever the object changes
+
+        Parameters
+        ----------
+        method : bound method
+            The method to call
+        """
+        ref = weakref.WeakMethod(method)
+        if ref not in self._listeners:
+            self._listeners = (*self._listeners,ref)
+
+    def remove_listener(self,method):
+        """Stop calling a method registered with add_listener"""
+        ref = weakref.WeakMethod(method)
+        self._listeners = tuple(r for r in self._listeners if r != ref)
+
+    def _notify_listeners(self):
+        """Call the live listeners and forget the dead ones"""
+        if self._listeners:
+            for ref in self._listeners:
+                method = ref()
+                if method is not None:
+                    method()
+            self._listeners = tuple(ref for ref in self._listeners
+                                    if ref() is not None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_listeners',None)
+        return state
+
+
+class Coordinates(Listenable):
     """Handle Affine transformations between coordinate spaces.
 
     The transformation represents a Rotation, Scale and Translation around an
@@ -34,7 +77,14 @@ class Coordinates():
 
     transform_matrix : read only 3x3 ndarray of floats
         The affine transformation matrix based on Xposition, Yposition,
-        scale, and rotation_angle
+        scale, and rotation_angle.  Recalculated when read after a
+        change, in place, so copy it to keep an earlier value.
+
+    inverse_matrix : read only 3x3 ndarray of floats
+        The inverse of transform_matrix
+
+    Objects that need to know when the transformation changes register a
+    method with add_listener.
     """
 
     def __init__(self,position=None, about_point=None,
@@ -51,7 +101,9 @@ class Coordinates():
         self._about_point = (Vector(0.0,0.0,0.0) if (about_point is None)
                             else about_point)
 
-        self._calc_matrix()
+        self._matrix = np.zeros((3,3)).view(Affine2d)
+        self._inverse = None
+        self._dirty = True
 
     @property
     def position(self):
@@ -60,7 +112,7 @@ class Coordinates():
     @position.setter
     def position(self,val):
         self._position = Vector(val)
-        self._calc_matrix()
+        self._changed()
 
     @property
     def about_point(self):
@@ -68,14 +120,14 @@ class Coordinates():
 
     @about_point.setter
     def about_point(self,val):
-        self._about_point = Vector(val)
+        val = Vector(val)
 
         # Update the position so the transform matrix stays the same.
-        rot = Affine2d(rotation=self.rotation_angle)
-        ap  = Affine2d(offset=-self._about_point)
-
-        pos = self._matrix*scipy.linalg.inv(rot*ap)
-        self.position     = Vectors([0.0,0.0]).apply_affine_transform(pos)
+        # The new about point has to land where it is now.
+        m = self.transform_matrix
+        self._about_point = val
+        self.position = Vector(m[0,0]*val[0]+m[0,1]*val[1]+m[0,2],
+                               m[1,0]*val[0]+m[1,1]*val[1]+m[1,2])
 
     @property
     def rotation_angle(self):
@@ -84,7 +136,7 @@ class Coordinates():
     @rotation_angle.setter
     def rotation_angle(self,angle):
         self._rotation_angle = angle
-        self._calc_matrix()
+        self._changed()
 
     @property
     def scale(self):
@@ -101,14 +153,34 @@ class Coordinates():
             val.z = 1.0
 
         self._scale = Vector(val)
-
-
-        self._calc_matrix()
+        self._changed()
 
     @property
     def transform_matrix(self):
+        if self._dirty:
+            self._calc_matrix()
         return self._matrix
 
+    @property
+    def inverse_matrix(self):
+        if self._dirty or self._inverse is None:
+            m = self.transform_matrix
+            det = m[0,0]*m[1,1]-m[0,1]*m[1,0]
+            if det == 0:
+                raise np.linalg.LinAlgError("singular transform matrix")
+
+            # Inverse of the linear part, then undo the offset
+            inv = np.zeros((3,3)).view(Affine2d)
+            inv[0,0] =  m[1,1]/det
+            inv[0,1] = -m[0,1]/det
+            inv[1,0] = -m[1,0]/det
+            inv[1,1] =  m[0,0]/det
+            inv[0,2] = -(inv[0,0]*m[0,2]+inv[0,1]*m[1,2])
+            inv[1,2] = -(inv[1,0]*m[0,2]+inv[1,1]*m[1,2])
+            inv[2,2] = 1.0
+            self._inverse = inv
+        return self._inverse
+
     @transform_matrix.setter
     def transform_matrix(self,matrix):
 
@@ -123,19 +195,42 @@ class Coordinates():
     def external2internal(self,mcoords):
         """Convert external coordinates to internal coordinates."""
         fmcoords = Vectors(mcoords)
-        return fmcoords.apply_affine_transform(scipy.linalg.inv(self._matrix))
+        return fmcoords.apply_affine_transform(self.inverse_matrix)
 
     def internal2external(self,scoords):
         """Convert internal coordinates to external coordinates."""
         fscoords = Vectors(scoords)
-        return fscoords.apply_affine_transform(self._matrix)
+        return fscoords.apply_affine_transform(self.transform_matrix)
+
+    def _changed(self):
+        """Mark the matrices stale and tell the listeners"""
+        self._dirty = True
+        self._notify_listeners()
 
     def _calc_matrix(self):
-        rot = Affine2d(rotation=self.rotation_angle)
-        sc  = Affine2d(scale=self.scale)
-        pos = Affine2d(offset=self.position)
-        ap  = Affine2d(offset=-self.about_point)
-        self._matrix = pos*sc*rot*ap
+        """Fill the transform matrix in place
+
+        Equivalent to Affine2d(offset=position)*Affine2d(scale=scale)*
+        Affine2d(rotation=rotation_angle)*Affine2d(offset=-about_point)
+        """
+        c = math.cos(self._rotation_angle)
+        s = math.sin(self._rotation_angle)
+        sx = float(self._scale[0])
+        sy = float(self._scale[1]) if self._scale[1] != 0 else sx
+        ax = float(self._about_point[0])
+        ay = float(self._about_point[1])
+
+        m = self._matrix
+        m[0,0] = sx*c
+        m[0,1] = -sx*s
+        m[1,0] = sy*s
+        m[1,1] = sy*c
+        m[0,2] = self._position[0] - m[0,0]*ax - m[0,1]*ay
+        m[1,2] = self._position[1] - m[1,0]*ax - m[1,1]*ay
+        m[2,:] = (0.0,0.0,1.0)
+
+        self._inverse = None
+        self._dirty = False
 
     def __mul__(self,other):
         """Multiply the transformation matrices"""
@@ -219,17 +314,27 @@ class Vectors(np.ndarray):
             If there are less than 3, remaining columns will be filled
             with zeros.
         """
-        shape = np.array(data).shape
+        try:
+            arr = np.asarray(data,dtype=float)
+        except ValueError:
+            arr = None
 
-        if len(shape)==1:
-            _data = np.array(Vector(data))
-        else:
+        if arr is None:
+            # Ragged rows, fall back to converting vector by vector
             _data = np.zeros((len(data),3))
-
             for row,datum in enumerate(data):
                 _data[row,:] = Vector(datum)
+            return _data.view(cls)
+
+        if arr.ndim > 2 or arr.shape[-1] > 3:
+            raise ValueError("Vectors can be initialized with " +
+                             "a maximum of 3 components")
 
-        return np.asarray(_data).view(cls)
+        # Copy and pad with zeros in a single step
+        _data = np.zeros(arr.shape[:-1]+(3,))
+        _data[...,:arr.shape[-1]] = arr
+
+        return _data.view(cls)
 
     def get_vector(self,index):
         """Get a vector"""
@@ -249,35 +354,22 @@ class Vectors(np.ndarray):
             -    A 3d transformation is applied
         """
 
-        # Get the shape of the transform matrix
-        trans_dims,_   = transform_matrix.shape
-
-        if len(self.shape) == 1:
-            num_vecs = 1
-            vec = self[None,:]
-        else:
-            num_vecs,_  = self.shape
-            vec = self[:]
-
-        # Create the augmented coordinate matrix
-        aug = np.ones((num_vecs,trans_dims))
-        aug[:,:-1] = vec[:,:(trans_dims-1)]
-
-        # Perform the transform
-        aug = transform_matrix.dot(aug.transpose()).transpose()
-
-        if trans_dims == 3:
-            # Put z components back
-            aug[:,2] = vec[:,2]
-        else:
-            # Strip augmented column
-            aug = aug[:,:-1]
+        mat = np.asarray(transform_matrix)
+        vec = np.asarray(self)
+        dims = mat.shape[0]-1
 
+        # Apply the linear part and the offset without building the
+        # augmented coordinate matrix.  z components are kept for a 2d
+        # transformation.
+        aug = vec.copy()
+        aug[...,:dims] = vec[...,:dims].dot(mat[:dims,:dims].T) + mat[:dims,dims]
 
-        if num_vecs == 1:
-            return Vector(aug[0])
+        if aug.ndim == 1:
+            return aug.view(Vector)
+        elif len(aug) == 1:
+            return aug[0].view(Vector)
         else:
-            return Vectors(aug)
+            return aug.view(Vectors)
 
 
 class Vector(np.ndarray):
@@ -314,6 +406,15 @@ class Vector(np.ndarray):
 
         if isinstance(x,np.ndarray) and len(x) == 3:
             data = x   # Go fast if this is a numpy array
+        elif isinstance(x,(float,int)):
+            return np.array((x,y,z),dtype=float).view(cls)
+        elif (isinstance(x,(list,tuple)) or 
+              (isinstance(x,np.ndarray) and x.ndim == 1)) and len(x) < 3:
+            # Short sequences are padded in one step
+            data = np.zeros(3)
+            data[:len(x)] = x
+        elif isinstance(x,(list,tuple)) and len(x) == 3:
+            data = np.array(x,dtype=float)
         else:
 
             try:
@@ -449,9 +550,13 @@ class Vector(np.ndarray):
                 r*math.cos(phi))
 
     def __sub__(self,other):
-        return super().__sub__(Vector(other))
+        if not isinstance(other,Vector):
+            other = Vector(other)
+        return super().__sub__(other)
     
     def __add__(self,other):
-        return super().__add__(Vector(other))
+        if not isinstance(other,Vector):
+            other = Vector(other)
+        return super().__add__(other)
     
 
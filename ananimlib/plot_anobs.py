@@ -343,7 +343,7 @@ class CoordAxis(al.CompositeAnObject):
 
 
         self.clear()
-        self._coordinates = al.Coordinates()
+        self.coordinates = al.Coordinates()
 
         self.scale = self.screen_size*self.grid_size**-1.
         self.origin=0
@@ -421,7 +421,7 @@ class CoordAxis(al.CompositeAnObject):
         self.add_anobject(self._title_mob)
 
 
-        self._coordinates =  old_coords
+        self.coordinates =  old_coords
 
 
 class PlotPoints(al.CompositeAnObject):
@@ -40,6 +40,10 @@ class Render():
 class CairoRender(Render):
     """Abstract base class for Cairo Render."""
 
+    # Device units per curve unit when building a cached path.  Coordinates
+    # keep 1/65536 unit resolution up to +/-32768 units.
+    path_scale = 256.0
+
     def __init__(self):
 
         # When render is called, we need parent_render to run first
@@ -65,19 +69,41 @@ class CairoRender(Render):
         Handle matrix manipulations
         Set the clip region
         call the child render
+
+        While a composite tree is rendered from its top, the matrix
+        taking each AnObject to the top of the tree is kept on the
+        AnObject and only rebuilt after its coordinates, or those of a
+        composite above it, change.
         """
         # Be a good citizen and save the existing context state
         camera.context.save()
 
+        # Work out where we are in the tree being rendered.  chain holds
+        # the AnObject rendering us and the matrix at the top of its tree,
+        # or False once we've left the tree.
+        outer = getattr(camera,'_render_chain',None)
+        if outer is None and anobject.parent is None:
+            chain = (anobject,camera.context.get_matrix())
+        elif outer and anobject.parent is outer[0]:
+            chain = (anobject,outer[1])
+        else:
+            chain = False
 
         # Set up the new transform matrix
-        cmat = camera.context.get_matrix()
-        transform_matrix = anobject.transform_matrix
-        my_mat = cairo.Matrix(
-            transform_matrix[0,0],-transform_matrix[0,1],
-            -transform_matrix[1,0],transform_matrix[1,1],
-            transform_matrix[0,2],transform_matrix[1,2]
-        )
+        if chain and anobject._cairo_matrix is not None:
+            my_mat = anobject._cairo_matrix
+        else:
+            my_mat = self._cairo_matrix(anobject.transform_matrix)
+
+            if chain:
+                if anobject.parent is not None:
+                    my_mat = my_mat.multiply(anobject.parent._cairo_matrix)
+                anobject._cairo_matrix = my_mat
+
+        if chain:
+            cmat = chain[1]
+        else:
+            cmat = camera.context.get_matrix()
 
         # Apply the transform matrix to the cairo context
         camera.context.set_matrix(my_mat.multiply(cmat))
@@ -88,11 +114,24 @@ class CairoRender(Render):
             camera.context.clip()
 
         # Call the child class render
-        self.child_render(anobject,camera)
+        camera._render_chain = chain
+        try:
+            self.child_render(anobject,camera)
+        finally:
+            camera._render_chain = outer
 
         # Restore the original context
         camera.context.restore()
 
+    @staticmethod
+    def _cairo_matrix(transform_matrix):
+        """Convert a 3x3 affine matrix into a cairo Matrix"""
+        return cairo.Matrix(
+            transform_matrix[0,0],-transform_matrix[0,1],
+            -transform_matrix[1,0],transform_matrix[1,1],
+            transform_matrix[0,2],transform_matrix[1,2]
+        )
+
     def render(self,data,camera):
         """Render the data on the cairo context contained in camera"""
 
@@ -102,9 +141,12 @@ class CairoRender(Render):
     def set_path(self, path, context):
         """Draw the path described by the bezier curve into the context
 
+        The path of a PolyBezier is kept on the curve after the first
+        call and appended directly until the curve changes.
+
         Parameters
         ----------
-        path : PolyBezier
+        path : PolyBezier or TrimmedPolyBezier
             The path to set.
 
         context : Cairo Context
@@ -113,32 +155,47 @@ class CairoRender(Render):
 
         context.new_path()
 
-        # Draw each curve in the path
-        p3 = None       # Keep track of endpoints while setting the path
-        p0 = None
-        for segment in path:
-            s_p0 = segment._coefficients[0]
-            s_p1 = segment._coefficients[1]
-            s_p2 = segment._coefficients[2]
-            s_p3 = segment._coefficients[3]
-
-            if p3 is not None:
-                diff = p3-s_p0
-
-            # New path if ending point of the previous segment does
-            # not match the beginning of current segment
-            if p3 is None or np.sqrt(diff[0]**2+diff[1]**2+diff[2]**2) > 1e-9:
-
-                # Save the starting point and begin the new path
-                p0 = s_p0
-                context.move_to(s_p0[0],s_p0[1])
-
-            # Draw the curve
-            context.curve_to(s_p1[0], s_p1[1],
-                             s_p2[0], s_p2[1],
-                             s_p3[0], s_p3[1])
-            # save the end point
-            p3 = s_p3
+        # Reuse the path from an earlier render if the curve hasn't changed
+        cached = getattr(path,'_cairo_path',None)
+        if cached is not None:
+            context.append_path(cached)
+            return
+
+        # Trimmed views change every frame and aren't cached
+        if not isinstance(path,al.PolyBezier):
+            self._emit_path(path,context)
+            return
+
+        # Cairo stores paths in 24.8 fixed point device coordinates.  Build
+        # the cached copy on a fixed fine grid instead of the current 
+        # transform so that it is equally accurate at every later scale.
+        matrix = context.get_matrix()
+        context.set_matrix(cairo.Matrix(self.path_scale,0,0,
+                                        self.path_scale,0,0))
+        self._emit_path(path,context)
+        path._cairo_path = context.copy_path()
+        context.set_matrix(matrix)
+
+        context.new_path()
+        context.append_path(path._cairo_path)
+
+    def _emit_path(self, path, context):
+        """Draw the segments of the curve into the context"""
+
+        # Draw each curve in the path.  Straight segments are drawn as
+        # lines and a new sub-path begins wherever a segment does not
+        # start at the end of the previous one.
+        for data,linear,starts in path.segment_blocks:
+            for seg,line,start in zip(data[:,:,:2].tolist(),
+                                      linear.tolist(),
+                                      starts.tolist()):
+                if start:
+                    context.move_to(*seg[0])
+
+                if line:
+                    context.line_to(*seg[3])
+                else:
+                    context.curve_to(*seg[1],*seg[2],*seg[3])
 
 
 class ImageRender(CairoRender):
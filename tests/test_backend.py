@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the frame backends
+"""
+
+import numpy as np
+
+def _frames(num=10,width=64,height=48):
+    """A small red square moving across a black background"""
+    frames = []
+    for i in range(num):
+        frame = np.zeros((height,width,4),dtype=np.uint8)
+        frame[:,:,3] = 255
+        frame[10:20,2*i:2*i+10,0] = 255
+        frames.append(frame)
+    return frames
+
+def test_gif_writer(tmp_path):
+    import ananimlib as al
+    from PIL import Image
+
+    frames = _frames()
+    fname = str(tmp_path / "test.gif")
+    al.GIFWriter(fname,frame_rate=25).write(frames)
+
+    im = Image.open(fname)
+    assert(im.n_frames == len(frames))
+
+    # Every frame should come back with its original colors
+    for i,frame in enumerate(frames):
+        im.seek(i)
+        rgb = np.array(im.convert('RGB'))
+        np.testing.assert_array_equal(rgb,frame[:,:,:3])
+
+def test_gif_writer_palette(tmp_path):
+    import ananimlib as al
+    from PIL import Image
+
+    # Flat colors away from 0 and 255 are kept exactly
+    frame = np.zeros((16,16,3),dtype=np.uint8)
+    frame[:,:8] = (200,100,50)
+    frame[:,8:] = (30,144,255)
+    fname = str(tmp_path / "flat.gif")
+    al.GIFWriter(fname,frame_rate=25).write([frame])
+
+    rgb = np.array(Image.open(fname).convert('RGB'))
+    np.testing.assert_array_equal(rgb,frame)
+
+def test_gif_writer_delta(tmp_path):
+    import ananimlib as al
+    from PIL import Image
+
+    # Hold the last frame for a few extra frames
+    frames = _frames()
+    frames += [frames[-1]]*3
+
+    full = str(tmp_path / "full.gif")
+    delta = str(tmp_path / "delta.gif")
+    al.GIFWriter(full,frame_rate=25,delta=False).write(frames)
+    al.GIFWriter(delta,frame_rate=25,delta=True).write(frames)
+
+    # Repeated frames are merged into the last one
+    im = Image.open(delta)
+    assert(im.n_frames == len(frames)-3)
+
+    # Frames are composited back into the originals
+    for i in range(im.n_frames):
+        im.seek(i)
+        rgb = np.array(im.convert('RGB'))
+        np.testing.assert_array_equal(rgb,frames[i][:,:,:3])
+
+    im.seek(im.n_frames-1)
+    assert(im.info['duration'] == 4*40)
+
+def test_image_sequence_backend(tmp_path):
+    import ananimlib as al
+    from PIL import Image
+
+    frames = _frames()
+    backend = al.ImageSequenceBackend(64,48,25,"seq",outDir=str(tmp_path),
+                                      digits=3,num_threads=2,queue_size=2)
+    backend.start()
+    for frame in frames:
+        backend.addFrame(frame)
+    backend.end()
+
+    for i,frame in enumerate(frames):
+        image = np.array(Image.open(str(tmp_path / f"seq_{i:03d}.png")))
+        np.testing.assert_array_equal(image,frame)
+
+def test_image_sequence_backend_restart(tmp_path):
+    import ananimlib as al
+    from PIL import Image
+
+    # Two Animate calls continue the same numbered sequence
+    frames = _frames()
+    backend = al.ImageSequenceBackend(64,48,25,"seq",outDir=str(tmp_path),
+                                      digits=3)
+    for cycle in (frames[:4],frames[4:]):
+        backend.start()
+        for frame in cycle:
+            backend.addFrame(frame)
+        backend.end()
+
+    assert(backend.frame_number == len(frames))
+    for i,frame in enumerate(frames):
+        image = np.array(Image.open(str(tmp_path / f"seq_{i:03d}.png")))
+        np.testing.assert_array_equal(image,frame)
+
+def test_fan_out_backend(tmp_path):
+    import ananimlib as al
+
+    frames = _frames()
+    full = al.Backend(64,48,25)
+    small = al.Backend(64,48,25)
+    fan = al.FanOutBackend([full,small],downscale=[1,2],decimate=[1,3])
+
+    fan.start()
+    for frame in frames:
+        fan.addFrame(frame)
+    fan.end()
+
+    assert(small.frame_rate == 25/3)
+    assert(len(full.frames) == len(frames))
+    assert(len(small.frames) == 4)
+    np.testing.assert_array_equal(full.frames[5],frames[5])
+
+    # The downscaled frames are block averages of the originals
+    expected = frames[3].reshape(24,2,32,2,4).mean(axis=(1,3))
+    np.testing.assert_allclose(small.frames[1],expected,atol=0.5)
+
+def test_fan_out_backend_restart():
+    import ananimlib as al
+
+    frames = _frames()
+    small = al.Backend(64,48,25)
+    fan = al.FanOutBackend([small],decimate=[3])
+
+    # Decimation carries on across Animate calls
+    for half in (frames[:5],frames[5:]):
+        fan.start()
+        for frame in half:
+            fan.addFrame(frame)
+        fan.end()
+
+    assert(fan.frame_number == len(frames))
+    assert(len(small.frames) == 4)
+
+def test_fan_out_backend_error():
+    import ananimlib as al
+    import pytest
+
+    class Broken(al.Backend):
+        def addFrame(self,frame):
+            raise RuntimeError("broken")
+
+    frames = _frames()
+    good = al.Backend(64,48,25)
+    fan = al.FanOutBackend([good,Broken(64,48,25)])
+
+    fan.start()
+    with pytest.raises(RuntimeError):
+        for frame in frames:
+            fan.addFrame(frame)
+        fan.end()
+
+    # Every consumer thread was stopped before the error was raised
+    assert(len(fan._threads) == 0)
+    assert(len(good.frames) > 0)
+
+def test_preview_backend(monkeypatch):
+    import ananimlib as al
+
+    # Render the preview window off screen
+    monkeypatch.setenv("SDL_VIDEODRIVER","dummy")
+
+    frames = _frames()
+    preview = al.PreviewBackend(64,48,25)
+    preview.start()
+    for frame in frames:
+        preview.addFrame(frame)
+    preview.end()
+
+    # Every frame is converted even when it is not displayed
+    assert(len(preview.surfaces) == len(frames))
+    assert(len(preview.frames) == 0)
+    assert(preview.dropped < len(frames))
+    preview.play_movie(repeat=0)
+    assert(preview.screen is None)
+
+    # Raw frames are only kept on request
+    preview = al.PreviewBackend(64,48,25,keep_frames=True)
+    preview.start()
+    for frame in frames:
+        preview.addFrame(frame)
+    preview.end()
+    assert(len(preview.frames) == len(frames))
+    preview.close()
+    assert(preview.screen is None)
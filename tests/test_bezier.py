@@ -51,5 +51,428 @@ def test_PolyBezier_T_2D():
         np.testing.assert_allclose(u_recovered, u_orig,rtol=0,atol=1e-7)
 #test_PolyBezier_T()
 
+def test_arc_lengths():
+
+    import ananimlib.bezier as bz
+
+    # Straight lines have exact lengths
+    curve = bz.PolyBezier()
+    curve.connect_linear([[0,0,0],[3,4,0],[3,0,0]])
+    np.testing.assert_allclose(curve.lengths,[5.0,4.0],rtol=1e-12)
+
+    # Compare a curved segment against a dense polyline approximation
+    curve = bz.BezierCurve([[0,0,0],[1,2,0],[3,-1,0],[4,1,0]])
+    p = curve.B(np.linspace(0,1,200001))
+    polyline = np.sum(np.sqrt(np.sum(np.diff(p,axis=0)**2,axis=1)))
+    np.testing.assert_allclose(curve.arc_length,polyline,rtol=1e-8)
+
+    # D at half the distance lands half way along the curve
+    half = curve.D(0.5)
+    t = np.linspace(0,1,200001)
+    dist = np.concatenate(([0],np.cumsum(np.sqrt(np.sum(
+        np.diff(p,axis=0)**2,axis=1)))))
+    expected = curve.B(np.interp(0.5*dist[-1],dist,t))
+    np.testing.assert_allclose(half,expected,atol=1e-4)
+
+def test_PolyBezier_D():
+
+    import ananimlib.bezier as bz
+
+    curve = bz.PolyBezier()
+    curve.connect_smooth([[0,0,0],[1,2,0],[2,3,0],[4,1,0]])
+
+    # Dense polyline through the whole curve
+    t = np.linspace(0,3,300001)
+    p = curve.B_array(t)
+    dist = np.concatenate(([0],np.cumsum(np.sqrt(np.sum(
+        np.diff(p,axis=0)**2,axis=1)))))
+
+    for d in [0.0,0.1,0.45,0.7,1.0]:
+        expected = curve.B(np.interp(d*dist[-1],dist,t))
+        np.testing.assert_allclose(curve.D(d),expected,atol=1e-4)
+
+    # The lookup tables persist between calls until the points change
+    table = curve._distances
+    curve.D(0.2)
+    assert(curve._distances is table)
+    curve.points = curve.points*2
+    assert(curve._distances is None)
+    np.testing.assert_allclose(curve.D(1.0),[8,2,0],atol=1e-9)
+
+def test_PolyBezier_find_segment():
+
+    import ananimlib.bezier as bz
+
+    # Three segments of length 1, 2, and 1
+    curve = bz.PolyBezier()
+    curve.connect_linear([[0,0,0],[1,0,0],[3,0,0],[4,0,0]])
+
+    seg,tseg = curve.find_segment(0.5)
+    assert(seg == 1)
+    np.testing.assert_allclose(tseg,0.5)
+
+    # Arrays of t map to arrays of segments
+    seg,tseg = curve.find_segment(np.array([0.0,0.125,0.5,0.875,1.0]))
+    np.testing.assert_array_equal(seg,[0,0,1,2,2])
+    np.testing.assert_allclose(tseg,[0.0,0.5,0.5,0.5,1.0])
+
+def test_PolyBezier_array_evaluation():
+
+    import ananimlib.bezier as bz
+    import pytest
+
+    curve = bz.PolyBezier()
+    curve.connect_smooth([[0,0,0],[1,2,0],[3,1,0],[4,3,0]])
+
+    # Batched evaluation agrees with the scalar methods
+    t = np.linspace(0,2.75,12)
+    for name in ['B','Bprime','Bdprime']:
+        expected = [getattr(curve,name)(tt) for tt in t]
+        np.testing.assert_allclose(getattr(curve,name+'_array')(t),
+                                   expected,atol=1e-12)
+
+    d = np.linspace(0,1,13)
+    for name in ['D','Dprime','Ddprime']:
+        expected = [getattr(curve,name)(dd) for dd in d]
+        np.testing.assert_allclose(getattr(curve,name+'_array')(d),
+                                   expected,atol=1e-12)
+
+    # An empty curve has nothing to evaluate
+    empty = bz.PolyBezier()
+    for name in ['B','Bprime','Bdprime','D','Dprime','Ddprime']:
+        with pytest.raises(ValueError):
+            getattr(empty,name+'_array')(d)
+
+def test_PolyBezier_extend():
+
+    import ananimlib.bezier as bz
+
+    segments = np.random.rand(10,4,3)
+
+    # Growing one segment at a time matches a single bulk extend
+    curve = bz.PolyBezier()
+    for seg in segments:
+        curve.add_segment(seg)
+
+    bulk = bz.PolyBezier()
+    bulk.extend(segments[:3])
+    bulk.extend(segments[3:])
+
+    assert(len(curve) == 10)
+    np.testing.assert_array_equal(curve.points,segments.reshape(40,3))
+    np.testing.assert_array_equal(bulk.points,curve.points)
+
+    # connect_linear appends to what is already there
+    curve.connect_linear([[0,0],[1,0],[1,1]])
+    assert(len(curve) == 12)
+    np.testing.assert_array_equal(curve[-1][3],[1,1,0])
+
+def test_PolyBezier_bounding_box():
+
+    import ananimlib.bezier as bz
+
+    # A single arch whose top is at y = 0.75, inside the control points
+    curve = bz.PolyBezier()
+    curve.add_segment(np.array([[0,0,0],[0,1,0],[1,1,0],[1,0,0]],
+                               dtype=float))
+    curve.connect_linear([[1,0],[2,-1]])
+
+    np.testing.assert_allclose(curve.bounding_box,[[0,-1,0],[2,0.75,0]])
+
+    # The cached box follows the curve
+    curve.shift([1,1,0])
+    np.testing.assert_allclose(curve.bounding_box,[[1,0,0],[3,1.75,0]])
+    np.testing.assert_allclose(curve.bounding_box,curve.calc_bounding_box())
+
+def test_TrimmedPolyBezier():
+
+    import ananimlib.bezier as bz
+
+    curve = bz.PolyBezier()
+    curve.connect_smooth([[0,0,0],[1,2,0],[3,1,0],[4,3,0]])
+
+    view = bz.TrimmedPolyBezier(curve,0.6)
+
+    # Whole segments are shared with the original curve
+    assert(len(view) == len(view.head)+1)
+    assert(np.shares_memory(view.head,curve._data))
+
+    # The view ends at the point 60% of the way along the curve
+    np.testing.assert_allclose(view.tail[0,0],view.head[-1,3])
+    np.testing.assert_allclose(view.tail[0,3],curve.D(0.6))
+    np.testing.assert_allclose(view.length,0.6*curve.length,rtol=1e-5)
+
+def test_split_curves():
+
+    import ananimlib.bezier as bz
+
+    curves = np.random.rand(5,4,3)
+    t = np.linspace(0.1,0.9,5)
+
+    # Each curve split at its own t
+    left,right = bz.split_curves(curves,t)
+    for curve,tt,l,r in zip(curves,t,left,right):
+        np.testing.assert_allclose(l[3],bz.BezierCurve(curve).B(tt))
+        np.testing.assert_allclose(r[0],l[3])
+        np.testing.assert_allclose(bz.BezierCurve(l).B(0.5),
+                                   bz.BezierCurve(curve).B(0.5*tt))
+
+    # One curve split at many t
+    left,right = bz.split_curves(curves[0],t)
+    assert(left.shape == (5,4,3))
+    np.testing.assert_allclose(right[:,3],np.repeat(curves[0,3:],5,axis=0))
+
+def test_PolyBezier_flatten():
+
+    import ananimlib.bezier as bz
+
+    curve = bz.PolyBezier()
+    curve.connect_smooth([[0,0,0],[1,2,0],[3,1,0],[4,3,0]])
+    curve.connect_linear([[5,0],[6,0]])
+
+    lines = curve.flatten(1e-3)
+
+    # One polyline for each connected piece, ending where the pieces end
+    assert(len(lines) == 2)
+    np.testing.assert_allclose(lines[0][[0,-1]],[[0,0,0],[4,3,0]])
+    np.testing.assert_allclose(lines[1][[0,-1]],[[5,0,0],[6,0,0]])
+
+    # Midpoints of the chords stay within tolerance of the curve
+    mid = 0.5*(lines[0][1:]+lines[0][:-1])
+    dense = curve.B_array(np.linspace(0,3,30001))
+    dist = np.linalg.norm(mid[:,None,:]-dense[None,:,:],axis=2).min(axis=1)
+    assert(dist.max() < 1e-3)
+
+    # Results are cached until the curve changes
+    assert(curve.flatten(1e-3) is lines)
+    curve.shift([1,0,0])
+    assert(curve.flatten(1e-3) is not lines)
+
+def test_PolyBezier_simplify():
+
+    import ananimlib.bezier as bz
+
+    # A grid line drawn one cell at a time, then a repeated corner point
+    curve = bz.PolyBezier()
+    x = np.linspace(0,10,11)
+    curve.connect_linear(np.array([x,0*x]).T)
+    curve.connect_linear([[10,0],[10,0],[10,5]])
+    box = curve.bounding_box
+
+    curve.simplify()
+    assert(len(curve) == 2)
+    np.testing.assert_allclose(curve.points[[0,3,4,7]],
+                               [[0,0,0],[10,0,0],[10,0,0],[10,5,0]])
+    np.testing.assert_allclose(curve.bounding_box,box)
+
+    # Lines that double back are kept
+    curve = bz.PolyBezier()
+    curve.connect_linear([[0,0],[2,0],[1,0]])
+    curve.simplify()
+    assert(len(curve) == 2)
+
+    # Subdivided cubics fit back into fewer segments
+    curve = bz.PolyBezier()
+    curve.connect_smooth([[0,0],[1,1],[2,0]])
+    original = curve.B_array(np.linspace(0,2,2001))
+    for t in np.linspace(0.1,0.9,9):
+        curve.add_point(t)
+
+    curve.simplify(fit_tol=1e-4)
+    assert(len(curve) < 11)
+    dense = curve.B_array(np.linspace(0,len(curve),201))
+    dist = np.linalg.norm(dense[:,None,:]-original[None,:,:],axis=2)
+    assert(dist.min(axis=1).max() < 1e-3)
+
+def test_PolyBezier_linear():
+
+    import ananimlib.bezier as bz
+
+    curve = bz.PolyBezier()
+    curve.connect_linear([[0,0],[1,0],[1,1]])
+    curve.connect_smooth([[2,2],[3,3],[4,2]])
+
+    np.testing.assert_array_equal(curve.linear,[True,True,False,False])
+    np.testing.assert_array_equal(curve.subpath_starts,[1,0,1,0])
+
+    # The trimmed view reuses the masks of the original curve
+    view = bz.TrimmedPolyBezier(curve,0.25)
+    (_,linear,starts),(tail,tail_linear,tail_starts) = view.segment_blocks
+    np.testing.assert_array_equal(linear,[True])
+    np.testing.assert_array_equal(tail_linear,[True])
+    np.testing.assert_array_equal(tail_starts,[0])
+
+def test_PolyBezier_cairo_path_cache():
+
+    import copy
+    import ananimlib.bezier as bz
+
+    curve = bz.PolyBezier()
+    curve.connect_linear([[0,0],[1,1]])
+
+    # Stand in for a path cached by the renderer
+    curve._cairo_path = object()
+
+    # Copies leave the cached path behind
+    assert(copy.deepcopy(curve)._cairo_path is None)
+    assert(curve._cairo_path is not None)
+
+    # Changing the curve discards it
+    curve.shift([1,0,0])
+    assert(curve._cairo_path is None)
+
+def test_PolyBezier_cairo_path_scales():
+
+    import cairo
+    import ananimlib as al
+
+    curve = al.PolyBezier()
+    curve.connect_smooth([[0,0],[0.3,0.7],[1.1,0.2],[1.5,1.3]])
+    render = al.CairoRender()
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,16,16)
+
+    def path_at(scale,cached):
+        context = cairo.Context(surface)
+        context.scale(scale,scale)
+        if cached:
+            render.set_path(curve,context)
+        else:
+            context.new_path()
+            render._emit_path(curve,context)
+        return np.array([p for kind,points in context.copy_path()
+                         for p in points])
+
+    # The path is cached at the first scale and reused at the second.  It
+    # should match a path drawn directly at either scale to within the
+    # resolution of the device.
+    for scale in (1.0,400.0):
+        cached = path_at(scale,True)
+        assert(curve._cairo_path is not None)
+        np.testing.assert_allclose(cached,path_at(scale,False),
+                                   atol=2/(256*scale))
+
+def test_SVGPolyBezier():
+
+    import ananimlib.bezier as bz
+
+    # Relative curveto repeats from the end of each curve
+    path = bz.SVGPolyBezier('m1 1 c0 1 1 1 1 0 0 1 1 1 1 0')
+    np.testing.assert_allclose(path.points[:,:2],
+                               [[1,-1],[1,-2],[2,-2],[2,-1],
+                                [2,-1],[2,-2],[3,-2],[3,-1]])
+
+    # Each value after H is a new line, and Z returns to the start
+    path = bz.SVGPolyBezier('M0 0 H1 3 V2 z')
+    np.testing.assert_allclose(path._data[:,3,:2],
+                               [[1,0],[3,0],[3,-2],[0,0]])
+
+    # Smooth curveto reflects the previous control point
+    path = bz.SVGPolyBezier('M0 0 C0 1 1 1 1 0 S2 -1 2 0 3 1 3 0')
+    np.testing.assert_allclose(path._data[1:,1,:2],[[1,1],[2,-1]])
+
+    # Parsed paths are cached and copied into each curve
+    bz.SVGPolyBezier('M0 0 H1 3 V2 z').shift([1,0,0])
+    cached = bz.parse_svg_path('M0 0 H1 3 V2 z')
+    np.testing.assert_allclose(cached[0,0],[0,0,0])
+    assert(not cached.flags.writeable)
+
+def test_PolyBezier_compact():
+
+    import ananimlib.bezier as bz
+    import pytest
+
+    points = [[0,0],[1,2],[3,1],[4,3]]
+    full = bz.PolyBezier()
+    full.connect_smooth(points)
+    curve = bz.PolyBezier(compact=True)
+    curve.connect_smooth(points)
+
+    assert(curve._stored.shape == (3,4,2))
+    assert(curve._stored.dtype == np.float32)
+
+    # Results come back in three dimensions
+    np.testing.assert_allclose(curve.points,full.points,atol=1e-6)
+    np.testing.assert_allclose(curve.bounding_box,full.bounding_box,
+                               atol=1e-6)
+    np.testing.assert_allclose(curve.D(0.5),full.D(0.5),atol=1e-5)
+    np.testing.assert_allclose(curve.B_array([0.5,2.5]),
+                               full.B_array([0.5,2.5]),atol=1e-5)
+    np.testing.assert_allclose(curve.length,full.length,rtol=1e-6)
+
+    # The full precision copy is read only, so edits can't be lost
+    with pytest.raises(ValueError):
+        curve.points[0,0] = 1.0
+
+    # Moving within the plane stays compact
+    curve.shift([1,1,0])
+    assert(curve.compact)
+    np.testing.assert_allclose(curve.bounding_box,
+                               full.bounding_box+[1,1,0],atol=1e-6)
+
+    # Leaving the plane switches to full storage
+    curve.add_segment(np.array([[5,4,0],[5,4,1],[6,4,1],[6,4,0]]))
+    assert(not curve.compact)
+    assert(curve._stored.shape == (4,4,3))
+
+def test_cubic_roots():
+
+    import ananimlib.bezier as bz
+
+    # (t-1)(t-2)(t-3), (t-2)(t**2+1), (t-1)(t-2), and 2t-1
+    roots = bz.cubic_roots([1,1,0,0],[-6,-2,1,0],[11,1,-3,2],[-6,-2,2,-1])
+    np.testing.assert_allclose(np.sort(roots[0]),[1,2,3])
+    np.testing.assert_allclose(roots[1,0],2)
+    np.testing.assert_allclose(np.sort(roots[2,:2]),[1,2])
+    np.testing.assert_allclose(roots[3,0],0.5)
+    assert(np.all(np.isnan(roots[1,1:])))
+
+def test_PolyBezier_spatial_queries():
+
+    import ananimlib.bezier as bz
+    import pytest
+
+    # A zig-zag of 200 straight segments between y = 0 and y = 1
+    x = np.arange(201)
+    curve = bz.PolyBezier()
+    curve.connect_linear(np.array([x,x%2]).T)
+
+    seg = curve.segments_in_box([[10.5,0,0],[12.5,1,0]])
+    np.testing.assert_array_equal(seg,[10,11,12])
+
+    point,t = curve.closest_point([50.5,2,0])
+    np.testing.assert_allclose(point,[51,1,0],atol=1e-9)
+    np.testing.assert_allclose(t,51,atol=1e-9)
+
+    with pytest.raises(ValueError):
+        bz.PolyBezier().closest_point([0,0,0])
+
+    points,t = curve.intersect([[100,0.5,0],[104,0.5,0]])
+    np.testing.assert_allclose(points[:,0],[100.5,101.5,102.5,103.5])
+    np.testing.assert_allclose(curve.B_array(t),points,atol=1e-9)
+
+def test_PolyBezier_T_array():
+
+    import ananimlib.bezier as bz
+    import pytest
+
+    x = np.linspace(0,2*np.pi,50)
+    curve = bz.PolyBezier()
+    curve.connect_smooth(np.array([x,np.sin(x)]).T)
+
+    # Read y at many x positions at once
+    probe = np.linspace(0,2*np.pi,1000)
+    t = curve.T_array(probe)
+    np.testing.assert_allclose(curve.B_array(t)[:,0],probe,atol=1e-12)
+    np.testing.assert_allclose(curve.B_array(t)[:,1],np.sin(probe),
+                               atol=1e-4)
+
+    # Agrees with the bisection in T
+    np.testing.assert_allclose(t[[100,500]],
+                               [curve.T(probe[100]),curve.T(probe[500])],
+                               atol=1e-5)
+
+    with pytest.raises(ValueError):
+        bz.PolyBezier().T_array(probe)
+
 if __name__=="__main__":
-    test_PolyBezier_T_2D()
\ No newline at end of file
+    test_PolyBezier_T_2D()
@@ -65,5 +65,114 @@ def test_composite_anobject_data_struct():
     assert(c0.get_anobject(['Composite1','Composite2','obj4']) is o4)
     
     
+def test_composite_parent_links():
+    import ananimlib as al
+    import numpy as np
+    import copy
+
+    c0 = al.CompositeAnObject()
+    c1 = al.CompositeAnObject()
+    o0 = al.Rectangle([1,1])
+
+    c0.add_anobject(c1,'Composite1')
+    c1.add_anobject(o0,'Obj0')
+    assert(o0.parent is c1 and c1.parent is c0)
+
+    # A copy of the tree keeps its own links
+    c2 = copy.deepcopy(c0)
+    o2 = c2.get_anobject(['Composite1','Obj0'])
+    assert(o2.parent is c2.get_anobject('Composite1'))
+    assert(c2.parent is None)
+
+    # A shallow copy shares the coordinates without taking them over
+    np.testing.assert_allclose(c1.bounding_box,[[-0.5,-0.5,0],[0.5,0.5,0]])
+    o3 = copy.copy(o0)
+    o0.position = [2,0]
+    np.testing.assert_allclose(c1.bounding_box,[[1.5,-0.5,0],[2.5,0.5,0]])
+
+    c1.clear()
+    assert(o0.parent is None)
+
+
+def test_composite_bounding_box():
+    import ananimlib as al
+    import numpy as np
+
+    c0 = al.CompositeAnObject()
+    c1 = al.CompositeAnObject()
+    o0 = al.Rectangle([1,1])
+    o1 = al.Rectangle([2,2])
+
+    c0.add_anobject(c1,'Composite1')
+    c1.add_anobject(o0,'Obj0')
+    c0.add_anobject(o1,'Obj1')
+
+    np.testing.assert_allclose(c0.bounding_box,[[-1,-1,0],[1,1,0]])
+
+    # Unchanged composites hand back the same box
+    assert(c0.bounding_box is c0.bounding_box)
+
+    # Moving an AnObject further down reaches the top
+    o0.position = [3,0]
+    np.testing.assert_allclose(c1.bounding_box,[[2.5,-0.5,0],[3.5,0.5,0]])
+    np.testing.assert_allclose(c0.bounding_box,[[-1,-1,0],[3.5,1,0]])
+
+    # So does changing a path in place
+    o0.data.connect_linear([[0.5,0.5],[0.5,4]])
+    np.testing.assert_allclose(c0.bounding_box,[[-1,-1,0],[3.5,4,0]])
+
+    c1.scale = 2
+    np.testing.assert_allclose(c0.bounding_box,[[-1,-1,0],[7,8,0]])
+
+    # Every AnObject drawing a shared path hears when it changes
+    path = al.PolyBezier()
+    path.connect_linear([[0,0],[1,1]])
+    c2 = al.CompositeAnObject()
+    c3 = al.CompositeAnObject()
+    c2.add_anobject(al.BezierAnObject(path),'Obj2')
+    c3.add_anobject(al.BezierAnObject(path),'Obj3')
+    np.testing.assert_allclose(c2.bounding_box,[[0,0,0],[1,1,0]])
+    np.testing.assert_allclose(c3.bounding_box,[[0,0,0],[1,1,0]])
+
+    path.connect_linear([[1,1],[2,3]])
+    np.testing.assert_allclose(c2.bounding_box,[[0,0,0],[2,3,0]])
+    np.testing.assert_allclose(c3.bounding_box,[[0,0,0],[2,3,0]])
+
+
+def test_composite_matrix_invalidation():
+    import ananimlib as al
+
+    c0 = al.CompositeAnObject()
+    c1 = al.CompositeAnObject()
+    c2 = al.CompositeAnObject()
+    o0 = al.Rectangle([1,1])
+
+    c0.add_anobject(c1,'Composite1')
+    c1.add_anobject(c2,'Composite2')
+    c2.add_anobject(o0,'Obj0')
+
+    # Stand in for the matrices cached by the renderer
+    tree = [c0,c1,c2,o0]
+    for anobject in tree:
+        anobject._cairo_matrix = object()
+
+    # Moving a mid-level composite clears everything below it
+    c1.position = [1,2]
+    assert(c0._cairo_matrix is not None)
+    for anobject in tree[1:]:
+        assert(anobject._cairo_matrix is None)
+
+    # Moving the grandchild only clears its own matrix
+    for anobject in tree:
+        anobject._cairo_matrix = object()
+    o0.rotation_angle = 0.5
+    assert(o0._cairo_matrix is None)
+    for anobject in tree[:-1]:
+        assert(anobject._cairo_matrix is not None)
+
+
 if __name__=="__main__":
-    test_composite_anobject_data_struct()
\ No newline at end of file
+    test_composite_anobject_data_struct()
+    test_composite_parent_links()
+    test_composite_bounding_box()
+    test_composite_matrix_invalidation()
\ No newline at end of file
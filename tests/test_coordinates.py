@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the affine coordinate transforms
+"""
+
+import numpy as np
+
+
+def test_Coordinates_matrix():
+
+    import ananimlib as al
+    from ananimlib.coordinates import Affine2d
+
+    coords = al.Coordinates()
+    coords.position = [1,2]
+    coords.scale = [2,3]
+    coords.rotation_angle = np.pi/6
+    coords.about_point = [0.5,-0.5]
+
+    # The matrix is rebuilt when read after a change
+    expected = (Affine2d(offset=coords.position)*
+                Affine2d(scale=coords.scale)*
+                Affine2d(rotation=coords.rotation_angle)*
+                Affine2d(offset=-coords.about_point))
+    np.testing.assert_allclose(coords.transform_matrix,expected)
+
+    np.testing.assert_allclose(coords.inverse_matrix.dot(expected),
+                               np.eye(3),atol=1e-12)
+
+    # Moving the about point leaves the transform alone
+    coords.about_point = [3,1]
+    np.testing.assert_allclose(coords.transform_matrix,expected)
+
+def test_Coordinates_round_trip():
+
+    import ananimlib as al
+
+    coords = al.Coordinates(position=al.Vector(1,2),rotation_angle=0.3,
+                            scale=al.Vector(2,0.5,1))
+    points = np.array([[0,0,0],[1,2,0],[-3,4,5]],dtype=float)
+
+    np.testing.assert_allclose(
+        coords.external2internal(coords.internal2external(points)),
+        points,atol=1e-12)
+
+    coords.rotation_angle = 1.2
+    np.testing.assert_allclose(
+        coords.internal2external(coords.external2internal(points)),
+        points,atol=1e-12)
+
+
+def test_Vectors():
+
+    import ananimlib as al
+
+    # Two and three column arrays are padded or copied in one go
+    pts = np.array([[1.,2.],[3.,4.]])
+    vecs = al.Vectors(pts)
+    assert isinstance(vecs,al.Vectors)
+    np.testing.assert_array_equal(vecs,[[1,2,0],[3,4,0]])
+
+    pts = np.array([[1.,2.,3.]])
+    vecs = al.Vectors(pts)
+    vecs[0,0] = 5.
+    assert pts[0,0] == 1.
+
+    vec = al.Vectors([1,2])
+    np.testing.assert_array_equal(vec,[1,2,0])
+
+    # Ragged rows are converted one vector at a time
+    vecs = al.Vectors([[1,2],[3,4,5]])
+    np.testing.assert_array_equal(vecs,[[1,2,0],[3,4,5]])
+
+    # Short sequences and arrays are padded to three components
+    for short in ([1,2],(1.,2.),np.array([1.,2.])):
+        vec = al.Vector(short)
+        assert isinstance(vec,al.Vector)
+        np.testing.assert_array_equal(vec,[1,2,0])
+
+    # A single vector comes back out of a transform as a Vector
+    coords = al.Coordinates()
+    coords.position = [1,1]
+    assert isinstance(coords.internal2external([1,2]),al.Vector)
+    np.testing.assert_allclose(coords.internal2external([[1,2],[3,4]]),
+                               [[2,3,0],[4,5,0]])